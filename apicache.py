@@ -0,0 +1,107 @@
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+CACHE_PATH = Path(".cache") / "api" / "responses.sqlite3"
+# Only answers that say something about the content itself are worth replaying.
+CACHED_STATUSES = {200, 404}
+CACHED_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    url TEXT NOT NULL,
+    identity TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    body BLOB NOT NULL,
+    fetched REAL NOT NULL,
+    PRIMARY KEY (url, identity)
+);
+"""
+
+
+class CacheMiss(LookupError):
+    """Replay mode asked for a response that was never recorded."""
+
+
+@dataclass
+class CachedResponse:
+    """The parts of a requests.Response that radar and download read."""
+
+    status_code: int
+    content: bytes
+    headers: dict[str, str] = field(default_factory=dict)
+    fetched: float = 0.0
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class ResponseCache:
+    """API responses keyed by URL and the identity (cookie key and hash) that fetched them.
+
+    Responses are always recorded. They are served back when younger than
+    ``ttl`` seconds (0 never serves them), and in ``replay`` mode they are
+    served regardless of age while a missing one raises CacheMiss, so a run
+    never touches the network. Safe to share between threads.
+    """
+
+    def __init__(self, path: Path = CACHE_PATH, *, ttl: float = 0, replay: bool = False) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.replay = replay
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def lookup(self, url: str, identity: str) -> Optional[CachedResponse]:
+        """The cached response to use instead of a request, if any."""
+        if not (self.replay or self.ttl):
+            return None
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT status, headers, body, fetched FROM responses WHERE url = ? AND identity = ?",
+                (url, identity),
+            ).fetchone()
+        if row is None or not (self.replay or time.time() - row[3] < self.ttl):
+            if self.replay:
+                raise CacheMiss(f"No recorded response for {url} as {identity or 'anonymous'}")
+            return None
+        status, headers, body, fetched = row
+        return CachedResponse(status, zlib.decompress(body), json.loads(headers), fetched)
+
+    def store(self, url: str, identity: str, response) -> None:
+        if response.status_code not in CACHED_STATUSES:
+            return
+        headers = {
+            name: response.headers[name] for name in CACHED_HEADERS if name in response.headers
+        }
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    url,
+                    identity,
+                    response.status_code,
+                    json.dumps(headers),
+                    zlib.compress(response.content),
+                    time.time(),
+                ),
+            )
+
+    def touch(self, url: str, identity: str) -> None:
+        """Mark a recorded response as current again, e.g. after a 304."""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "UPDATE responses SET fetched = ? WHERE url = ? AND identity = ?",
+                (time.time(), url, identity),
+            )
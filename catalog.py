@@ -0,0 +1,151 @@
+import hashlib
+import json
+import sqlite3
+from pathlib import Path
+from typing import Iterable
+
+from corpus import SOURCE_DIRS, Corpus
+from plaintext import count_characters, forget_documents, plain_text
+
+CATALOG_PATH = Path(".cache") / "catalog.sqlite3"
+# Bump when a column is added or derived differently; the catalog is then rebuilt.
+CATALOG_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    kind TEXT NOT NULL,
+    stem TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    error TEXT,
+    title TEXT,
+    question_id TEXT,
+    author TEXT,
+    voteup_count INTEGER,
+    created INTEGER,
+    updated INTEGER,
+    chars INTEGER,
+    PRIMARY KEY (kind, stem)
+);
+"""
+COLUMNS = (
+    "kind",
+    "stem",
+    "mtime_ns",
+    "size",
+    "hash",
+    "error",
+    "title",
+    "question_id",
+    "author",
+    "voteup_count",
+    "created",
+    "updated",
+    "chars",
+)
+
+
+def describe(kind: str, stem: str, data: dict) -> dict:
+    """The catalog columns derived from one article or answer payload."""
+    if "error" in data:
+        return {"error": json.dumps(data["error"], ensure_ascii=False)}
+    question = data.get("question") or {}
+    content = data.get("content")
+    created = data.get("created_time") or data.get("created")
+    return {
+        "title": question.get("title", "Untitled") if kind == "answer" else data.get("title", ""),
+        "question_id": str(question["id"]) if "id" in question else None,
+        "author": (data.get("author") or {}).get("name"),
+        "voteup_count": data.get("voteup_count"),
+        "created": created,
+        "updated": data.get("updated_time") or data.get("updated") or created,
+        # Documents without a body have no character count.
+        "chars": count_characters(plain_text(content, f"{kind}/{stem}/content")) if content else None,
+    }
+
+
+class Catalog:
+    """Per-document metadata kept in SQLite so listings need not parse bodies.
+
+    ``refresh`` re-reads only documents whose source size or mtime changed,
+    and re-parses only those whose content hash changed as well.
+    """
+
+    def __init__(self, path: Path = CATALOG_PATH) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        (version,) = self.conn.execute("PRAGMA user_version").fetchone()
+        with self.conn:
+            if version != CATALOG_VERSION:
+                self.conn.execute("DROP TABLE IF EXISTS documents")
+                self.conn.execute(f"PRAGMA user_version = {CATALOG_VERSION}")
+            self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def refresh(self, corpus: Corpus, kinds: Iterable[str] = SOURCE_DIRS) -> int:
+        """Bring the catalog in line with the corpus; returns rows re-parsed."""
+        parsed = 0
+        for kind in kinds:
+            known = {
+                row["stem"]: row
+                for row in self.conn.execute(
+                    "SELECT stem, mtime_ns, size, hash FROM documents WHERE kind = ?", (kind,)
+                )
+            }
+            signatures = corpus.stems(kind)
+            changed = [
+                stem
+                for stem, signature in signatures.items()
+                if stem not in known
+                or (known[stem]["mtime_ns"], known[stem]["size"]) != signature
+            ]
+            removed = known.keys() - signatures.keys()
+            rows = []
+            for stem, raw in corpus.iter_read_bytes(kind, changed):
+                mtime_ns, size = signatures[stem]
+                row = known.get(stem)
+                digest = hashlib.sha256(raw).hexdigest()
+                if row and row["hash"] == digest:
+                    with self.conn:
+                        self.conn.execute(
+                            "UPDATE documents SET mtime_ns = ?, size = ? WHERE kind = ? AND stem = ?",
+                            (mtime_ns, size, kind, stem),
+                        )
+                    continue
+                try:
+                    columns = describe(kind, stem, json.loads(raw))
+                except ValueError:
+                    columns = {"error": "not a valid json file"}
+                columns.update(kind=kind, stem=stem, mtime_ns=mtime_ns, size=size, hash=digest)
+                rows.append(tuple(columns.get(column) for column in COLUMNS))
+            with self.conn:
+                self.conn.executemany(
+                    f"INSERT OR REPLACE INTO documents VALUES ({', '.join('?' * len(COLUMNS))})",
+                    rows,
+                )
+                self.conn.executemany(
+                    "DELETE FROM documents WHERE kind = ? AND stem = ?",
+                    ((kind, stem) for stem in removed),
+                )
+            forget_documents(kind, removed)
+            parsed += len(rows)
+        return parsed
+
+    def documents(self, kind: str) -> list[dict]:
+        """All rows of one kind, most upvoted first."""
+        return [
+            dict(row)
+            for row in self.conn.execute(
+                "SELECT * FROM documents WHERE kind = ? ORDER BY voteup_count DESC, stem",
+                (kind,),
+            )
+        ]
+
+    def hashes(self, kind: str) -> dict[str, str]:
+        return dict(
+            self.conn.execute("SELECT stem, hash FROM documents WHERE kind = ?", (kind,))
+        )
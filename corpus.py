@@ -0,0 +1,237 @@
+import argparse
+import json
+import os
+import sqlite3
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+STORE_PATH = Path("corpus.sqlite3")
+SOURCE_DIRS = {"article": Path("article"), "answer": Path("answer")}
+# iter_read_bytes reads documents in batches on a helper thread, keeping up to
+# READ_AHEAD batches queued beyond the one being handed out.
+READ_BATCH = 16
+READ_AHEAD = 4
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    kind TEXT NOT NULL,
+    stem TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    body BLOB NOT NULL,
+    PRIMARY KEY (kind, stem)
+);
+"""
+
+
+def source_path(kind: str, stem: str) -> Path:
+    return SOURCE_DIRS[kind] / f"{stem}.json"
+
+
+class Corpus:
+    """Archived articles and answers, read from a packed store when there is one.
+
+    The store keeps each source file's exact bytes zlib-compressed in one
+    SQLite file, so a checkout can carry it instead of thousands of JSON
+    files. Where the JSON directories exist they stay authoritative: ``sync``
+    copies changed files into the store, and documents are read from the
+    files, which is cheaper than decompressing them. Without a store
+    everything is read from the directories.
+    """
+
+    def __init__(self, store: Path = STORE_PATH) -> None:
+        self.store = store
+        self.conn: Optional[sqlite3.Connection] = None
+        if store.exists():
+            self.conn = sqlite3.connect(store)
+            self.conn.executescript(SCHEMA)
+
+    @classmethod
+    def create(cls, store: Path = STORE_PATH) -> "Corpus":
+        sqlite3.connect(store).close()
+        return cls(store)
+
+    def close(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
+
+    def _directory_stems(self, kind: str) -> dict[str, tuple[int, int]]:
+        stems = {}
+        for file in SOURCE_DIRS[kind].glob("*.json"):
+            stat = file.stat()
+            stems[file.stem] = (stat.st_mtime_ns, stat.st_size)
+        return stems
+
+    def available(self, kind: str) -> bool:
+        return SOURCE_DIRS[kind].exists() or bool(self.stems(kind))
+
+    def stems(self, kind: str) -> dict[str, tuple[int, int]]:
+        """Map each document of ``kind`` to the (mtime_ns, size) of its source file."""
+        if self.conn is None:
+            return self._directory_stems(kind) if SOURCE_DIRS[kind].exists() else {}
+        return {
+            stem: (mtime_ns, size)
+            for stem, mtime_ns, size in self.conn.execute(
+                "SELECT stem, mtime_ns, size FROM documents WHERE kind = ?", (kind,)
+            )
+        }
+
+    def read_bytes(self, kind: str, stem: str) -> bytes:
+        if self.conn is None or SOURCE_DIRS[kind].exists():
+            return source_path(kind, stem).read_bytes()
+        return self._read_packed(self.conn, kind, stem)
+
+    @staticmethod
+    def _read_packed(conn: sqlite3.Connection, kind: str, stem: str) -> bytes:
+        row = conn.execute(
+            "SELECT body FROM documents WHERE kind = ? AND stem = ?", (kind, stem)
+        ).fetchone()
+        if row is None:
+            raise FileNotFoundError(f"{kind} {stem} is not in the corpus")
+        return zlib.decompress(row[0])
+
+    def load(self, kind: str, stem: str) -> dict:
+        return json.loads(self.read_bytes(kind, stem))
+
+    def iter_read_bytes(self, kind: str, stems: Iterable[str]) -> Iterator[tuple[str, bytes]]:
+        """Yield (stem, source bytes) in order while a thread reads the next ones.
+
+        File reads, SQLite lookups and decompression release the GIL, so they
+        overlap with whatever the caller does with each document.
+        """
+        reader = None
+        if self.conn is not None and not SOURCE_DIRS[kind].exists():
+            # Used only from the read-ahead thread.
+            reader = sqlite3.connect(self.store, check_same_thread=False)
+
+        def read_batch(batch: list[str]) -> list[bytes]:
+            if reader is None:
+                return [source_path(kind, stem).read_bytes() for stem in batch]
+            return [self._read_packed(reader, kind, stem) for stem in batch]
+
+        pool = ThreadPoolExecutor(max_workers=1)
+        pending: deque = deque()
+        stems = iter(stems)
+        try:
+            while True:
+                batch = list(islice(stems, READ_BATCH))
+                if batch:
+                    pending.append((batch, pool.submit(read_batch, batch)))
+                if not pending:
+                    break
+                if batch and len(pending) <= READ_AHEAD:
+                    continue
+                batch, future = pending.popleft()
+                yield from zip(batch, future.result())
+        finally:
+            # A caller that stops early leaves queued reads to cancel.
+            pool.shutdown(cancel_futures=True)
+            if reader is not None:
+                reader.close()
+
+    def iter_load(self, kind: str, stems: Iterable[str]) -> Iterator[tuple[str, dict]]:
+        """Like iter_read_bytes, with each document decoded."""
+        for stem, raw in self.iter_read_bytes(kind, stems):
+            yield stem, json.loads(raw)
+
+    def sync(self, kinds: Iterable[str] = SOURCE_DIRS) -> int:
+        """Copy new and changed source files into the store; returns how many."""
+        if self.conn is None:
+            return 0
+        copied = 0
+        for kind in kinds:
+            if not SOURCE_DIRS[kind].exists():
+                continue
+            packed = self.stems(kind)
+            present = self._directory_stems(kind)
+            with self.conn:
+                for stem, signature in present.items():
+                    if packed.get(stem) == signature:
+                        continue
+                    body = zlib.compress(source_path(kind, stem).read_bytes(), 9)
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?)",
+                        (kind, stem, *signature, body),
+                    )
+                    copied += 1
+                self.conn.executemany(
+                    "DELETE FROM documents WHERE kind = ? AND stem = ?",
+                    ((kind, stem) for stem in packed.keys() - present.keys()),
+                )
+        return copied
+
+    def export(self, kinds: Iterable[str] = SOURCE_DIRS) -> int:
+        """Write the packed documents back out as JSON files, keeping their mtimes."""
+        written = 0
+        for kind in kinds:
+            SOURCE_DIRS[kind].mkdir(exist_ok=True)
+            for stem, (mtime_ns, _) in self.stems(kind).items():
+                target = source_path(kind, stem)
+                target.write_bytes(self._read_packed(self.conn, kind, stem))
+                os.utime(target, ns=(mtime_ns, mtime_ns))
+                written += 1
+        return written
+
+
+def archived_stems(kind: str) -> list[str]:
+    """Stems of one kind, from its directory when present and otherwise from the store."""
+    if SOURCE_DIRS[kind].exists():
+        return [file.stem for file in SOURCE_DIRS[kind].glob("*.json")]
+    return list(shared_corpus().stems(kind))
+
+
+_shared: Optional[tuple[int, Corpus]] = None
+
+
+def shared_corpus() -> Corpus:
+    """A read-only Corpus per process, for worker processes that load documents."""
+    global _shared
+    if _shared is None or _shared[0] != os.getpid():
+        _shared = (os.getpid(), Corpus())
+    return _shared[1]
+
+
+def open_corpus() -> Corpus:
+    """Open the corpus and bring the store up to date with the JSON directories."""
+    corpus = Corpus()
+    copied = corpus.sync()
+    if copied:
+        print(f"Packed {copied} changed documents into {STORE_PATH}")
+    return corpus
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="在 JSON 目录与打包存储 corpus.sqlite3 之间转换归档内容。")
+    parser.add_argument(
+        "command",
+        choices=("pack", "export"),
+        help="pack：把 article/ 与 answer/ 打包（增量）进存储；export：从存储导出逐篇 JSON 文件。",
+    )
+    parser.add_argument(
+        "--store",
+        type=Path,
+        default=STORE_PATH,
+        help=f"打包存储文件（默认：{STORE_PATH}）。存在时其他脚本会从中读取内容。",
+    )
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        corpus = Corpus.create(args.store)
+        copied = corpus.sync()
+        corpus.close()
+        print(f"Packed {copied} changed documents into {args.store} ({args.store.stat().st_size:,} bytes)")
+    else:
+        if not args.store.exists():
+            parser.error(f"{args.store} does not exist")
+        corpus = Corpus(args.store)
+        written = corpus.export()
+        corpus.close()
+        print(f"Exported {written} documents")
+
+
+if __name__ == "__main__":
+    main()
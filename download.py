@@ -1,87 +1,456 @@
-import requests  # type: ignore
+import argparse
+import hashlib
 import json
-from tqdm import tqdm  # type: ignore
-from pathlib import Path
+import os
 import random
 import time
-import dotenv
-import os
-from functools import wraps
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
 
+import dotenv
+import pandas as pd
+import requests  # type: ignore
+from requests.adapters import HTTPAdapter  # type: ignore
+from tqdm import tqdm  # type: ignore
 
-def retry_with_exponential_backoff(func):
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        wait_times = [60 * 2**i for i in range(1, 7)] + [
-            64 for _ in range(10)
-        ]  # 2min, 4min, 8min, 16min, 32min, 64min
-        last_exception = None
+from apicache import CACHE_PATH, CacheMiss, ResponseCache
+from links import canonical_path
+from ratelimit import TokenBucket
+from workqueue import DONE, FAILED, IN_FLIGHT, NOT_FOUND, PENDING, WorkQueue
 
-        for wait in wait_times:
-            try:
-                return func(*args, **kwargs)
-            except Exception as e:
-                print(e)
-                print(f"Attempt failed. Waiting {wait} seconds before retry...")
-                last_exception = e
-                time.sleep(wait)
+ANSWER_DIR = Path("answer")
+ARTICLE_DIR = Path("article")
+PATHS_FILE = Path("paths.json")
+NOT_FOUND_FILE = Path("not_found_paths.txt")
+QUEUE_PATH = Path(".cache") / "download" / "queue.sqlite3"
+DOWNLOADS_DIR = Path("downloads")
+MAX_BACKOFF = 1800
+# Candidate column names in the get_list.py CSVs, mapped to the stored JSON keys.
+LISTING_COLUMNS = {
+    "voteup_count": ("赞同", "赞同数", "赞同量", "点赞"),
+    "comment_count": ("评论", "评论数", "评论量"),
+}
+# Per-request tokens that differ on every fetch even when nothing changed.
+VOLATILE_KEYS = ("attached_info", "ab_param")
 
-        # if all retries failed, raise the last exception
-        raise last_exception
 
-    return wrapper
+class DownloadAborted(Exception):
+    """The API answered 403; carrying on would only burn through the list."""
 
 
-def download_content() -> None:
-    dotenv.load_dotenv()
-    answer_path = Path("answer")
-    answer_path.mkdir(exist_ok=True)
+@dataclass
+class FetchResult:
+    state: str
+    error: Optional[str] = None
+    changed: bool = False
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
 
-    article_path = Path("article")
-    article_path.mkdir(exist_ok=True)
 
-    with open("paths.json", "r", encoding="utf-8") as file:
+def sync_queue(queue: WorkQueue) -> None:
+    """Seed the queue from paths.json, the archive on disk and not_found_paths.txt."""
+    with open(PATHS_FILE, "r", encoding="utf-8") as file:
         paths = json.load(file)
+    queue.recover()
 
-    processed_links = set(answer_path.glob("*.json")) | set(article_path.glob("*.json"))
+    processed_links = set(ANSWER_DIR.glob("*.json")) | set(ARTICLE_DIR.glob("*.json"))
     processed_ids = set([file.stem for file in processed_links])
+    archived = [path for path in paths if path.split("/")[-1] in processed_ids]
+    queue.add(archived, DONE)
+    queue.add(paths)
+    # A pending archived path was requeued for a refresh that has not run yet.
+    queue.mark(archived, DONE, keep=(PENDING, IN_FLIGHT))
 
-    with open("not_found_paths.txt", "r", encoding="utf-8") as file:
+    with open(NOT_FOUND_FILE, "r", encoding="utf-8") as file:
         not_found_paths = set(file.read().splitlines())
+    queue.mark(not_found_paths, NOT_FOUND)
+
+
+def listing_count(value) -> Optional[int]:
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def load_listing(download_dir: Path = DOWNLOADS_DIR) -> dict[str, dict[str, int]]:
+    """Vote and comment counts per path from the get_list.py CSVs.
+
+    Files are read in name order, so the newest export wins.
+    """
+    listing: dict[str, dict[str, int]] = {}
+    if not download_dir.exists():
+        return listing
+    for csv_path in sorted(download_dir.glob("*.csv")):
+        df = pd.read_csv(csv_path)
+        if "链接" not in df.columns:
+            continue
+        columns = {
+            key: next((name for name in names if name in df.columns), None)
+            for key, names in LISTING_COLUMNS.items()
+        }
+        for row in df.to_dict("records"):
+            link = row["链接"]
+            path = canonical_path(link.strip()) if isinstance(link, str) else None
+            if path is None:
+                continue
+            counts = {}
+            for key, column in columns.items():
+                value = listing_count(row[column]) if column else None
+                if value is not None:
+                    counts[key] = value
+            listing[path] = counts
+    return listing
+
+
+def refresh_candidates(queue: WorkQueue, args: argparse.Namespace) -> list[str]:
+    """Archived paths likely to have changed since they were fetched.
+
+    That is every path with --refresh-all; otherwise paths whose counts in the
+    latest listing differ from the stored JSON, and paths edited within
+    --recent-days that were not checked in the last --refresh-interval hours.
+    """
+    listing = load_listing()
+    checked = queue.checked_times()
+    now = time.time()
+    edited_since = now - args.recent_days * 86400
+    checked_since = now - args.refresh_interval * 3600
+    candidates = []
+    for directory, prefix in ((ANSWER_DIR, "/answer/"), (ARTICLE_DIR, "/p/")):
+        for file in sorted(directory.glob("*.json")):
+            path = prefix + file.stem
+            if args.refresh_all:
+                candidates.append(path)
+                continue
+            with open(file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if "error" in data:
+                continue
+            counts = listing.get(path, {})
+            if any(data.get(key) != value for key, value in counts.items()):
+                candidates.append(path)
+                continue
+            if checked.get(path, 0) >= checked_since:
+                continue
+            updated = data.get("updated") or data.get("updated_time") or 0
+            if updated >= edited_since:
+                candidates.append(path)
+    return candidates
+
+
+def content_digest(payload: dict) -> str:
+    stable = {key: value for key, value in payload.items() if key not in VOLATILE_KEYS}
+    encoded = json.dumps(stable, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def unchanged_on_disk(target: Path, payload: dict) -> bool:
+    if not target.exists():
+        return False
+    try:
+        with open(target, "r", encoding="utf-8") as file:
+            existing = json.load(file)
+    except ValueError:
+        return False
+    return content_digest(existing) == content_digest(payload)
+
+
+def output_file(path: str) -> Path:
+    type_of_content = ANSWER_DIR if "answer" in path else ARTICLE_DIR
+    return type_of_content / f"{path.split('/')[-1]}.json"
+
 
-    paths = list(
-        filter(
-            lambda x: x not in not_found_paths,
-            paths,
-        )
+def make_session(pool_size: int) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def fetch_path(
+    session: requests.Session,
+    api: str,
+    path: str,
+    bucket: TokenBucket,
+    timeout: float,
+    validators: tuple[Optional[str], Optional[str]],
+    cache: Optional[ResponseCache] = None,
+) -> FetchResult:
+    """Make one attempt at path.
+
+    The result state is DONE, NOT_FOUND or PENDING when the attempt should be
+    retried later; a 403 raises DownloadAborted. Archived paths are requested
+    conditionally with their stored validators, and a payload that matches the
+    file on disk is not rewritten. Responses are recorded in and may be served
+    from ``cache``; in replay mode a path that was never recorded raises
+    CacheMiss.
+    """
+    target = output_file(path)
+    etag, last_modified = validators if target.exists() else (None, None)
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    url = api + path
+    response = cache.lookup(url, "") if cache else None
+    if response is None:
+        bucket.acquire()
+        try:
+            response = session.get(url, headers=headers, timeout=timeout)
+        except requests.RequestException as exc:
+            return FetchResult(PENDING, str(exc))
+        if cache:
+            if response.status_code == 304:
+                cache.touch(url, "")
+            else:
+                cache.store(url, "", response)
+    if response.status_code == 304:
+        return FetchResult(DONE, etag=etag, last_modified=last_modified)
+    if response.status_code == 403:
+        raise DownloadAborted(f"Failed to download {path}")
+    if response.status_code == 404:
+        return FetchResult(NOT_FOUND)
+    if response.status_code != 200:
+        return FetchResult(PENDING, f"HTTP {response.status_code}")
+    try:
+        payload = response.json()
+    except ValueError as exc:
+        return FetchResult(PENDING, str(exc))
+    if "error" in payload:
+        return FetchResult(PENDING, f"Error: {payload['error']}")
+
+    result = FetchResult(
+        DONE,
+        etag=response.headers.get("ETag"),
+        last_modified=response.headers.get("Last-Modified"),
     )
+    if unchanged_on_disk(target, payload):
+        return result
+    tmp_path = target.with_suffix(".tmp")
+    with open(tmp_path, "wb") as file:
+        file.write(response.content)
+    tmp_path.replace(target)
+    result.changed = True
+    return result
+
+
+def download_content(queue: WorkQueue, args: argparse.Namespace) -> int:
+    """Work through the queue with at most ``args.workers`` requests in flight.
 
-    paths = list(
-        filter(
-            lambda x: x.split("/")[-1] not in processed_ids,
-            paths,
-        )
+    A failed attempt only delays its own path, by ``args.backoff`` seconds
+    doubled per attempt; other paths keep flowing. With ``args.replay`` every
+    response comes from the cache and paths without one keep their place in
+    the queue for the next live run. Returns the number of files written.
+    """
+    ANSWER_DIR.mkdir(exist_ok=True)
+    ARTICLE_DIR.mkdir(exist_ok=True)
+    bucket = TokenBucket(args.rate, burst=args.workers)
+    session = make_session(args.workers)
+    cache = ResponseCache(args.cache, ttl=args.cache_ttl * 3600, replay=args.replay)
+    # Replay holds these in flight until it ends and then puts them back
+    # unchanged, as a deferral would also delay the next live run.
+    unrecorded: list[str] = []
+    executor = ThreadPoolExecutor(max_workers=args.workers)
+    in_flight: dict[Future, str] = {}
+    aborted: Optional[DownloadAborted] = None
+    written = 0
+    progress = tqdm(total=queue.counts().get(PENDING, 0))
+    try:
+        while True:
+            if aborted is None and len(in_flight) < args.workers:
+                for path in queue.claim(args.workers - len(in_flight)):
+                    future = executor.submit(
+                        fetch_path,
+                        session,
+                        args.api,
+                        path,
+                        bucket,
+                        args.timeout,
+                        queue.validators(path),
+                        cache,
+                    )
+                    in_flight[future] = path
+            upcoming = queue.next_eligible() if aborted is None else None
+            if not in_flight:
+                # Replay cannot make progress by waiting for a retry.
+                if upcoming is None or (args.replay and upcoming > time.time()):
+                    break
+                time.sleep(max(0.0, upcoming - time.time()))
+                continue
+
+            timeout = None
+            if upcoming is not None and len(in_flight) < args.workers:
+                timeout = max(0.0, upcoming - time.time())
+            done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except DownloadAborted as exc:
+                    queue.release(path)
+                    aborted = exc
+                    continue
+                except CacheMiss:
+                    unrecorded.append(path)
+                    continue
+                state = result.state
+                if state == PENDING:
+                    delay = min(args.backoff * 2 ** queue.attempts(path), MAX_BACKOFF)
+                    state = queue.fail(
+                        path, result.error, delay=delay + random.random(), max_attempts=args.attempts
+                    )
+                    if state != FAILED:
+                        continue
+                    print(f"Giving up on {path} after {args.attempts} attempts: {result.error}")
+                else:
+                    queue.finish(
+                        path, state, etag=result.etag, last_modified=result.last_modified
+                    )
+                    written += result.changed
+                if state == NOT_FOUND:
+                    print(f"Skipping {path} because it does not exist")
+                    with open(NOT_FOUND_FILE, "a", encoding="utf-8") as file:
+                        file.write(path + "\n")
+                progress.update()
+    finally:
+        progress.close()
+        executor.shutdown(wait=True, cancel_futures=True)
+        session.close()
+        cache.close()
+        for path in unrecorded:
+            queue.release(path)
+    if unrecorded:
+        print(f"{len(unrecorded)} paths had no recorded response to replay")
+    if aborted is not None:
+        raise aborted
+    return written
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="并发下载 paths.json 中尚未归档的回答和文章。")
+    parser.add_argument(
+        "--api",
+        default=os.getenv("API"),
+        help="内容接口地址前缀（默认：环境变量 API），可指向本地桩服务器做测试。",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="同时进行的请求数上限（默认：4）。",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=0.33,
+        help="全局每秒请求数上限（默认：0.33，约每 3 秒一次）。设为 0 可关闭限速。",
+    )
+    parser.add_argument(
+        "--attempts",
+        type=int,
+        default=5,
+        help="单个路径的最多尝试次数，用尽后标记为 failed（默认：5）。",
+    )
+    parser.add_argument(
+        "--backoff",
+        type=float,
+        default=60.0,
+        help="单个路径重试的初始退避秒数，之后每次翻倍，最长 30 分钟（默认：60）。",
     )
+    parser.add_argument(
+        "--queue",
+        type=Path,
+        default=QUEUE_PATH,
+        help=f"持久化下载队列的 SQLite 文件（默认：{QUEUE_PATH}）。",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="同时重新获取可能已变化的已归档内容：列表 CSV 中赞同/评论数与本地不符，或近期编辑过。",
+    )
+    parser.add_argument(
+        "--refresh-all",
+        action="store_true",
+        help="重新获取全部已归档内容，隐含 --refresh（仍会使用 ETag/Last-Modified 条件请求）。",
+    )
+    parser.add_argument(
+        "--recent-days",
+        type=float,
+        default=30.0,
+        help="--refresh 时，updated/updated_time 在最近多少天内的内容视为可能变化（默认：30）。",
+    )
+    parser.add_argument(
+        "--refresh-interval",
+        type=float,
+        default=24.0,
+        help="--refresh 时，最近多少小时内检查过的近期编辑内容不再重复获取（默认：24）。",
+    )
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="把此前已放弃（failed）的路径重新放回队列。",
+    )
+    parser.add_argument(
+        "--cache",
+        type=Path,
+        default=CACHE_PATH,
+        help=f"记录接口响应的 SQLite 缓存（默认：{CACHE_PATH}）。",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=0.0,
+        help="直接使用多少小时内缓存的响应而不发请求（默认：0，即总是请求，只记录）。",
+    )
+    parser.add_argument(
+        "--replay",
+        action="store_true",
+        help="完全离线运行：只使用缓存中的响应（不论新旧），没有缓存的路径留待下次联网运行。",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=10.0,
+        help="单次请求超时秒数（默认：10）。",
+    )
+    args = parser.parse_args()
+    if args.cache_ttl < 0:
+        parser.error("--cache-ttl 不能为负数。")
+    if not args.api:
+        parser.error("缺少接口地址：请设置环境变量 API 或传入 --api。")
+    if args.workers < 1:
+        parser.error("--workers 必须大于等于 1。")
+    if args.attempts < 1:
+        parser.error("--attempts 必须大于等于 1。")
+    return args
 
-    for path in tqdm(paths):
-        response = requests.get(os.getenv("API") + path, timeout=10)
-        if response.status_code == 403:
-            raise Exception(f"Failed to download {path}")
-        if response.status_code == 404:
-            print(f"Skipping {path} because it does not exist")
-            with open("not_found_paths.txt", "a", encoding="utf-8") as file:
-                file.write(path + "\n")
-            continue
-        if "error" in response.json():
-            raise Exception(f"Error: {response.json()['error']}")
-        type_of_content = "answer" if "answer" in path else "article"
-        id_of_content = path.split("/")[-1]
-        with open(f"{type_of_content}/{id_of_content}.json", "wb") as file:
-            file.write(response.content)
 
-        sleep_time = random.random() * 4 + 1
-        time.sleep(sleep_time)
+def main() -> None:
+    dotenv.load_dotenv()
+    args = parse_args()
+    queue = WorkQueue(args.queue)
+    try:
+        sync_queue(queue)
+        if args.retry_failed:
+            queue.retry_failed()
+        if args.refresh or args.refresh_all:
+            candidates = refresh_candidates(queue, args)
+            queue.add(candidates)
+            print(f"Refreshing {queue.requeue(candidates)} archived paths")
+        written = download_content(queue, args)
+        counts = queue.counts()
+    finally:
+        queue.close()
+    print(
+        f"Wrote {written} files. Done {counts.get(DONE, 0)}, not found {counts.get(NOT_FOUND, 0)}, "
+        f"failed {counts.get(FAILED, 0)}, pending {counts.get(PENDING, 0)}"
+    )
 
 
-download_content_with_retry = retry_with_exponential_backoff(download_content)
-download_content_with_retry()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Iterable, TextIO
+from xml.sax.saxutils import escape, quoteattr
+import zoneinfo
+
+ATOM_NS = "http://www.w3.org/2005/Atom"
+HISTORY_NS = "http://purl.org/syndication/history/1.0"
+TIMEZONE = zoneinfo.ZoneInfo("Asia/Shanghai")
+
+
+def atom_datetime(timestamp: int) -> str:
+    return datetime.fromtimestamp(timestamp, TIMEZONE).isoformat()
+
+
+def archive_page_name(page: int) -> str:
+    return f"feed-archive-{page}.xml"
+
+
+class AtomFeedWriter:
+    """Write an Atom document entry by entry instead of building it in memory.
+
+    ``load_content`` is called once per entry while it is being written, so at
+    most one entry body is held at a time.
+    """
+
+    def __init__(
+        self,
+        *,
+        base_url: str,
+        title: str,
+        subtitle: str,
+        language: str,
+        load_content: Callable[[str], str],
+    ) -> None:
+        self.base_url = base_url
+        self.title = title
+        self.subtitle = subtitle
+        self.language = language
+        self.load_content = load_content
+
+    def write(
+        self,
+        path: Path,
+        entries: list[dict],
+        *,
+        links: Iterable[tuple[str, str]] = (),
+        archive: bool = False,
+    ) -> None:
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            self._write_head(f, path.name, entries, links, archive)
+            for entry in entries:
+                self._write_entry(f, entry)
+            f.write("</feed>\n")
+        tmp_path.replace(path)
+
+    def _write_head(
+        self,
+        f: TextIO,
+        name: str,
+        entries: list[dict],
+        links: Iterable[tuple[str, str]],
+        archive: bool,
+    ) -> None:
+        feed_url = f"{self.base_url}/{name}"
+        # Derive <updated> from the content so unchanged feeds stay byte-identical.
+        updated = max((entry["updated"] for entry in entries), default=0)
+        f.write("<?xml version='1.0' encoding='UTF-8'?>\n")
+        f.write(
+            f"<feed xmlns={quoteattr(ATOM_NS)} xmlns:fh={quoteattr(HISTORY_NS)}"
+            f" xml:lang={quoteattr(self.language)}>"
+        )
+        f.write(f"<id>{escape(feed_url)}</id>")
+        f.write(f"<title>{escape(self.title)}</title>")
+        f.write(f"<subtitle>{escape(self.subtitle)}</subtitle>")
+        f.write(f"<updated>{atom_datetime(updated)}</updated>")
+        f.write(f"<link href={quoteattr(feed_url)} rel=\"self\"/>")
+        f.write(f"<link href={quoteattr(self.base_url + '/')} rel=\"alternate\"/>")
+        for rel, href in links:
+            f.write(f"<link href={quoteattr(href)} rel={quoteattr(rel)}/>")
+        f.write(
+            '<generator uri="https://github.com/L-M-Sherlock/ZhiHuArchive">'
+            "ZhiHuArchive</generator>"
+        )
+        f.write(f"<icon>{escape(self.base_url)}/favicon.ico</icon>")
+        f.write(f"<logo>{escape(self.base_url)}/favicon.ico</logo>")
+        if archive:
+            f.write("<fh:archive/>")
+
+    def _write_entry(self, f: TextIO, entry: dict) -> None:
+        archive_url = f"{self.base_url}/{entry['stem']}.html"
+        f.write("<entry>")
+        f.write(f"<id>{escape(archive_url)}</id>")
+        f.write(f"<title>{escape(entry['title'])}</title>")
+        f.write(f"<updated>{atom_datetime(entry['updated'])}</updated>")
+        f.write(f"<published>{atom_datetime(entry['created'])}</published>")
+        f.write(f"<link href={quoteattr(archive_url)} rel=\"alternate\"/>")
+        f.write(f"<link href={quoteattr(entry['source_url'])} rel=\"related\"/>")
+        f.write(f"<summary>{escape(entry['summary'])}</summary>")
+        f.write('<content type="html">')
+        f.write(escape(self.load_content(entry["stem"])))
+        f.write("</content>")
+        f.write("</entry>")
+
+
+def write_feeds(
+    writer: AtomFeedWriter,
+    output_dir: Path,
+    entries: list[dict],
+    *,
+    size: int,
+    archives: bool = False,
+) -> int:
+    """Write feed.xml with the newest ``size`` entries.
+
+    With ``archives``, older entries go to RFC 5005 archive documents of the
+    same size, numbered from the oldest so that full pages never change.
+    Returns the number of archive documents written.
+    """
+    ordered = sorted(entries, key=lambda entry: (entry["created"], entry["stem"]))
+    current = ordered[-size:] if size else []
+    older = ordered[: len(ordered) - len(current)]
+
+    pages: list[list[dict]] = []
+    if archives and size:
+        pages = [older[start : start + size] for start in range(0, len(older), size)]
+
+    feed_url = f"{writer.base_url}/feed.xml"
+    for number, page in enumerate(pages, start=1):
+        links = [("current", feed_url)]
+        if number > 1:
+            links.append(("prev-archive", archive_url(writer, number - 1)))
+        if number < len(pages):
+            links.append(("next-archive", archive_url(writer, number + 1)))
+        writer.write(
+            output_dir / archive_page_name(number),
+            page[::-1],
+            links=links,
+            archive=True,
+        )
+    remove_archive_pages(output_dir, keep=len(pages))
+
+    links = []
+    if pages:
+        links.append(("prev-archive", archive_url(writer, len(pages))))
+    writer.write(output_dir / "feed.xml", current[::-1], links=links)
+    return len(pages)
+
+
+def archive_url(writer: AtomFeedWriter, page: int) -> str:
+    return f"{writer.base_url}/{archive_page_name(page)}"
+
+
+def remove_archive_pages(output_dir: Path, keep: int) -> None:
+    for path in output_dir.glob("feed-archive-*.xml"):
+        suffix = path.stem.rsplit("-", 1)[-1]
+        if not suffix.isdigit() or int(suffix) > keep:
+            path.unlink()
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, Optional
+from urllib.parse import parse_qs, urlparse
+
+REDIRECT_HOST = "link.zhihu.com"
+ARTICLE_PATH = re.compile(r"^/p/(\d+)/?$")
+ANSWER_PATH = re.compile(r"^(?:/question/\d+)?/answer/(\d+)/?$")
+
+
+@dataclass
+class LinkStats:
+    hits: int = 0
+    misses: int = 0
+    external: int = 0
+    unresolved: Counter = field(default_factory=Counter)
+
+    def merge(self, other: "LinkStats") -> None:
+        self.hits += other.hits
+        self.misses += other.misses
+        self.external += other.external
+        self.unresolved.update(other.unresolved)
+
+    def to_dict(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "external": self.external,
+            "unresolved": dict(self.unresolved.most_common()),
+        }
+
+    @classmethod
+    def from_dict(cls, values: dict) -> "LinkStats":
+        return cls(
+            hits=values["hits"],
+            misses=values["misses"],
+            external=values["external"],
+            unresolved=Counter(values["unresolved"]),
+        )
+
+
+def unwrap_redirect(url: str) -> str:
+    """Return the target of a link.zhihu.com redirect, or ``url`` unchanged."""
+    full_url = "https:" + url if url.startswith("//") else url
+    parsed = urlparse(full_url)
+    if parsed.netloc.lower() != REDIRECT_HOST:
+        return url
+    target = parse_qs(parsed.query).get("target", [None])[0]
+    if not target:
+        return url
+    return target.replace("https%3A", "https:").replace("http%3A", "http:")
+
+
+def canonical_path(url: str) -> Optional[str]:
+    """Map any Zhihu article/answer URL to its ``paths.json`` form."""
+    parsed = urlparse(url)
+    host = parsed.netloc.lower()
+    if host and host != "zhihu.com" and not host.endswith(".zhihu.com"):
+        return None
+    match = ARTICLE_PATH.match(parsed.path)
+    if match:
+        return f"/p/{match.group(1)}"
+    match = ANSWER_PATH.match(parsed.path)
+    if match:
+        return f"/answer/{match.group(1)}"
+    return None
+
+
+class LinkIndex:
+    """Hashed lookup from Zhihu URLs of every form to archive pages."""
+
+    def __init__(self, pages: dict[str, str]) -> None:
+        self._pages = pages
+        self.stats = LinkStats()
+
+    @classmethod
+    def from_ids(cls, article_ids: Iterable[str], answer_ids: Iterable[str]) -> "LinkIndex":
+        pages = {f"/p/{_id}": f"./{_id}.html" for _id in article_ids}
+        pages.update({f"/answer/{_id}": f"./{_id}.html" for _id in answer_ids})
+        return cls(pages)
+
+    @classmethod
+    def from_directories(
+        cls, article_dir: Path = Path("article"), answer_dir: Path = Path("answer")
+    ) -> "LinkIndex":
+        return cls.from_ids(
+            (file.stem for file in article_dir.glob("*.json")),
+            (file.stem for file in answer_dir.glob("*.json")),
+        )
+
+    @classmethod
+    def from_paths(cls, paths_file: Path = Path("paths.json")) -> "LinkIndex":
+        with open(paths_file, "r", encoding="utf-8") as f:
+            paths = json.load(f)
+        return cls({path: f"./{path.split('/')[-1]}.html" for path in paths})
+
+    def __len__(self) -> int:
+        return len(self._pages)
+
+    @property
+    def version(self) -> str:
+        """Digest of the indexed pages; changes whenever a page is added or removed."""
+        digest = hashlib.sha256()
+        for path in sorted(self._pages):
+            digest.update(path.encode("utf-8") + b"\n")
+        return digest.hexdigest()
+
+    def resolve(self, url: str) -> str:
+        try:
+            target = unwrap_redirect(url)
+            path = canonical_path(target)
+        except ValueError as exc:
+            print(f"Failed to parse URL {url}: {exc}")
+            self.stats.external += 1
+            return url
+
+        if path is None:
+            self.stats.external += 1
+            return target
+        page = self._pages.get(path)
+        if page is None:
+            self.stats.misses += 1
+            self.stats.unresolved[target] += 1
+            return target
+        self.stats.hits += 1
+        return page
+
+    def take_stats(self) -> LinkStats:
+        """Return the statistics gathered so far and start counting afresh."""
+        stats, self.stats = self.stats, LinkStats()
+        return stats
@@ -0,0 +1,48 @@
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER_PATH = re.compile(r"^/api/v4/answers/(\d+)")
+ARTICLE_PATH = re.compile(r"^/api/v4/articles/(\d+)")
+
+
+def mock_response(path: str) -> tuple[int, dict]:
+    """Visible, uncollapsed content for every answer and article id."""
+    match = ANSWER_PATH.match(path)
+    if match:
+        return 200, {"id": match.group(1), "type": "answer", "is_collapsed": False}
+    match = ARTICLE_PATH.match(path)
+    if match:
+        return 200, {"id": match.group(1), "type": "article", "reaction_instruction": {}}
+    return 404, {"error": {"code": 4041, "message": "not found"}}
+
+
+def serve_mock_api(latency: float = 0.0) -> tuple[ThreadingHTTPServer, str]:
+    """Start a local stand-in for the api/v4 answer and article endpoints.
+
+    Each response is delayed by ``latency`` seconds to mimic the real API.
+    Returns the server, to shut down when done, and its base URL.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args) -> None:
+            pass
+
+        def do_GET(self) -> None:
+            if latency:
+                time.sleep(latency)
+            status, payload = mock_response(self.path)
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}"
@@ -0,0 +1,191 @@
+import hashlib
+import os
+import re
+import sqlite3
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import List, Optional
+
+from rewrite import ENTITIES, VOID_ELEMENTS, numeric_reference
+
+TEXT_CACHE_PATH = Path(".cache") / "plaintext.sqlite3"
+# Bump when PlainTextExtractor output changes so cached text is not reused.
+EXTRACTOR_VERSION = "2"
+# Bump when the cache tables change; the file is then migrated on open.
+TEXT_CACHE_VERSION = 1
+# Shorter markup (titles, names) is cheaper to parse than to look up.
+MIN_CACHED_LENGTH = 256
+
+
+class PlainTextExtractor(HTMLParser):
+    """HTML parser that converts markup into normalized plain text.
+
+    Matches BeautifulSoup's ``get_text(" ", strip=True)``: every tag and
+    comment separates words, and script, style and ruby annotation text is
+    left out.
+    """
+
+    SKIPPED_TAGS = {"script", "style", "template", "rt", "rp"}
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=False)
+        self._chunks: List[str] = []
+        self._stack: List[str] = []
+        self._skipping = 0
+
+    def _boundary(self) -> None:
+        self._chunks.append(" ")
+
+    def handle_starttag(self, tag: str, attrs) -> None:
+        self._boundary()
+        if tag not in VOID_ELEMENTS:
+            self._stack.append(tag)
+            if tag in self.SKIPPED_TAGS:
+                self._skipping += 1
+
+    def handle_startendtag(self, tag: str, attrs) -> None:
+        self._boundary()
+
+    def handle_endtag(self, tag: str) -> None:
+        self._boundary()
+        # Like a tree builder, an end tag closes everything opened after its start tag.
+        if tag in self._stack:
+            while True:
+                popped = self._stack.pop()
+                if popped in self.SKIPPED_TAGS:
+                    self._skipping -= 1
+                if popped == tag:
+                    break
+
+    def handle_data(self, data: str) -> None:
+        if not self._skipping:
+            self._chunks.append(data)
+
+    def handle_entityref(self, name: str) -> None:
+        self.handle_data(ENTITIES.get(name, f"&{name}"))
+
+    def handle_charref(self, name: str) -> None:
+        self.handle_data(numeric_reference(name))
+
+    def handle_comment(self, data: str) -> None:
+        self._boundary()
+
+    def handle_decl(self, decl: str) -> None:
+        self._boundary()
+
+    def handle_pi(self, data: str) -> None:
+        self._boundary()
+
+    def unknown_decl(self, data: str) -> None:
+        self._boundary()
+        if data.upper().startswith("CDATA["):
+            self.handle_data(data[len("CDATA[") :])
+            self._boundary()
+
+    def get_text(self) -> str:
+        return "".join(self._chunks)
+
+
+def html_to_plain_text(html_content: str) -> str:
+    parser = PlainTextExtractor()
+    parser.feed(html_content)
+    parser.close()
+    text = parser.get_text()
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def count_characters(text: str) -> int:
+    normalized = re.sub(r"\s+", "", text)
+    return len(normalized)
+
+
+class TextCache:
+    """Plain text of document fields in SQLite, one row per field.
+
+    Rows are keyed by a name such as ``answer/123/content`` and keep a hash
+    of the markup their text came from, so an edited document overwrites
+    its row instead of leaving a dead one behind. Several render worker
+    processes may share the file; each opens its own connection through
+    ``plain_text``. Open and close one in the parent before starting them,
+    so that a pending migration runs there.
+    """
+
+    def __init__(self, path: Path = TEXT_CACHE_PATH) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # Losing recent entries in a crash only costs re-extraction.
+        self.conn.execute("PRAGMA synchronous=OFF")
+        (version,) = self.conn.execute("PRAGMA user_version").fetchone()
+        if version != TEXT_CACHE_VERSION:
+            self._migrate()
+
+    def _migrate(self) -> None:
+        # Render workers may open the file at once; the write lock lets only
+        # the first of them set up the schema.
+        self.conn.execute("BEGIN IMMEDIATE")
+        (version,) = self.conn.execute("PRAGMA user_version").fetchone()
+        if version == TEXT_CACHE_VERSION:
+            self.conn.rollback()
+            return
+        # Rows keyed by markup hash alone were never removed; drop them once.
+        legacy = self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'texts'").fetchone()
+        self.conn.execute("DROP TABLE IF EXISTS texts")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS fields"
+            " (key TEXT PRIMARY KEY, hash TEXT NOT NULL, text TEXT NOT NULL)"
+        )
+        self.conn.execute(f"PRAGMA user_version = {TEXT_CACHE_VERSION}")
+        self.conn.commit()
+        if legacy:
+            self.conn.execute("VACUUM")
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def text(self, key: str, html: str) -> str:
+        digest = hashlib.sha256(f"{EXTRACTOR_VERSION}\0{html}".encode("utf-8")).hexdigest()
+        row = self.conn.execute("SELECT hash, text FROM fields WHERE key = ?", (key,)).fetchone()
+        if row and row[0] == digest:
+            return row[1]
+        text = html_to_plain_text(html)
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO fields VALUES (?, ?, ?)", (key, digest, text))
+        return text
+
+    def forget(self, prefix: str) -> None:
+        """Drop the rows of every field whose key starts with ``prefix``."""
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM fields WHERE substr(key, 1, ?) = ?", (len(prefix), prefix)
+            )
+
+
+_cache: Optional[tuple[int, TextCache]] = None
+
+
+def shared_text_cache() -> TextCache:
+    """One TextCache per process, for render worker processes."""
+    global _cache
+    if _cache is None or _cache[0] != os.getpid():
+        _cache = (os.getpid(), TextCache())
+    return _cache[1]
+
+
+def plain_text(html: str, key: Optional[str] = None) -> str:
+    """Whitespace-collapsed text of an HTML fragment.
+
+    With ``key`` naming the document field the markup belongs to, e.g.
+    ``answer/123/content``, the text is cached across runs.
+    """
+    if not html:
+        return ""
+    if key is None or len(html) < MIN_CACHED_LENGTH:
+        return html_to_plain_text(html)
+    return shared_text_cache().text(key, html)
+
+
+def forget_documents(kind: str, stems) -> None:
+    """Drop cached text of documents that left the archive."""
+    for stem in stems:
+        shared_text_cache().forget(f"{kind}/{stem}/")
@@ -1,16 +1,30 @@
 import argparse
+import hashlib
 from pathlib import Path
-import random
+import threading
 import time
 import requests  # type: ignore
+from requests.adapters import HTTPAdapter  # type: ignore
 import json
 from tqdm import tqdm  # type: ignore
 from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
 from dotenv import load_dotenv
+from typing import Iterator, Optional
 import os
 
-load_dotenv()
+from apicache import CACHE_PATH, ResponseCache
+from catalog import Catalog
+from corpus import Corpus, open_corpus
+from mock_zhihu import serve_mock_api
+from ratelimit import TokenBucket
+from recheck import CheckHistory, schedule
+
 _CENSORSHIP_PATH = Path("censorship.json")
+_JOURNAL_PATH = Path("censorship.jsonl")
+HISTORY_PATH = Path(".cache") / "radar" / "history.sqlite3"
+API_BASE = "https://www.zhihu.com"
 _USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36"
 OWNER_COOKIE_KEYS = {
     "Thoughts Memo": "COOKIE_A",
@@ -25,13 +39,6 @@ NOT_FOUND_CODE = 4041
 ANSWER_INCLUDE = "is_collapsed,collapse_reason,collapsed_by"
 
 
-def author_name_for_content(data: dict) -> str:
-    author_name = (data.get("author") or {}).get("name")
-    if not author_name:
-        raise RuntimeError(f"Cannot determine cookie for author: {author_name}")
-    return author_name
-
-
 def cookie_key_for_author(author_name: str) -> str:
     cookie_key = OWNER_COOKIE_KEYS.get(author_name)
     if not cookie_key:
@@ -53,14 +60,88 @@ def get_cookie(cookie_key: str) -> str:
     return cookie
 
 
-def _fetch_with_cookie(url: str, cookie_key: str) -> dict:
-    cookie = get_cookie(cookie_key)
-    headers = {"User-Agent": _USER_AGENT, "Cookie": cookie}
-    response = requests.get(url, headers=headers, timeout=30).json()
-    error = response.get("error")
-    if error and error.get("code") in AUTH_ERROR_CODES:
-        raise RuntimeError(f"{cookie_key} is invalid: {error}")
-    return response
+class Prober:
+    """One pooled session and one token bucket per cookie, shared across threads.
+
+    ``cookies`` overrides the .env lookup, e.g. with fake cookies for a dry run.
+    Responses go through ``cache`` when given, keyed by the cookie key and a
+    hash of the cookie, so a replaced cookie in .env does not reuse responses
+    fetched with the old one.
+    """
+
+    def __init__(
+        self,
+        *,
+        rate: float,
+        pool_size: int = 4,
+        cookies: Optional[dict[str, str]] = None,
+        cache: Optional[ResponseCache] = None,
+    ) -> None:
+        self.rate = rate
+        self.pool_size = pool_size
+        self.cache = cache
+        self._cookies = dict(cookies or {})
+        self._sessions: dict[str, requests.Session] = {}
+        self._buckets: dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def cookie(self, cookie_key: str) -> str:
+        with self._lock:
+            if cookie_key not in self._cookies:
+                self._cookies[cookie_key] = get_cookie(cookie_key)
+            return self._cookies[cookie_key]
+
+    def cache_identity(self, cookie_key: str) -> str:
+        digest = hashlib.sha256(self.cookie(cookie_key).encode("utf-8")).hexdigest()
+        return f"{cookie_key}:{digest[:16]}"
+
+    def _session(self, cookie_key: str) -> tuple[requests.Session, TokenBucket]:
+        cookie = self.cookie(cookie_key)
+        with self._lock:
+            session = self._sessions.get(cookie_key)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers.update({"User-Agent": _USER_AGENT, "Cookie": cookie})
+                self._sessions[cookie_key] = session
+                self._buckets[cookie_key] = TokenBucket(self.rate)
+            return session, self._buckets[cookie_key]
+
+    def fetch(self, url: str, cookie_key: str) -> dict:
+        identity = self.cache_identity(cookie_key) if self.cache else ""
+        cached = self.cache.lookup(url, identity) if self.cache else None
+        if cached is not None:
+            response = cached.json()
+        else:
+            session, bucket = self._session(cookie_key)
+            bucket.acquire()
+            reply = session.get(url, timeout=30)
+            if self.cache:
+                self.cache.store(url, identity, reply)
+            response = reply.json()
+        error = response.get("error")
+        if error and error.get("code") in AUTH_ERROR_CODES:
+            raise RuntimeError(f"{cookie_key} is invalid: {error}")
+        return response
+
+    def close(self) -> None:
+        for session in self._sessions.values():
+            session.close()
+
+
+def make_prober(args: argparse.Namespace, cache: Optional[ResponseCache]) -> Prober:
+    """The Prober for a run: fake cookies for a dry run, the .env ones otherwise.
+
+    Replay sends nothing but still needs the .env cookies, as responses are
+    recorded under a hash of the cookie that fetched them.
+    """
+    cookies = None
+    if args.dry_run:
+        cookie_keys = set(OWNER_COOKIE_KEYS.values()) | set(VISIBILITY_VIEWER_COOKIE_KEYS.values())
+        cookies = {cookie_key: f"dry-run-{cookie_key}" for cookie_key in cookie_keys}
+    return Prober(rate=args.rate, pool_size=args.workers, cookies=cookies, cache=cache)
 
 
 def response_not_found(response: dict) -> bool:
@@ -83,25 +164,18 @@ def answer_collapsed(response: dict) -> bool:
     return response.get("is_collapsed") is True
 
 
-def ensure_distinct_cookies(owner_cookie_key: str, viewer_cookie_key: str) -> None:
-    if get_cookie(owner_cookie_key) == get_cookie(viewer_cookie_key):
+def ensure_distinct_cookies(owner_cookie_key: str, viewer_cookie_key: str, prober: Prober) -> None:
+    if prober.cookie(owner_cookie_key) == prober.cookie(viewer_cookie_key):
         raise RuntimeError(
             f"{owner_cookie_key} and {viewer_cookie_key} are identical; "
             "visibility checks require a non-author viewer cookie."
         )
 
 
-def content_censored_check(
-    url: str,
-    owner_cookie_key: str,
-    viewer_cookie_key: str,
-    *,
-    check_answer_collapse: bool = False,
-    check_article_reaction: bool = False,
-) -> bool:
-    ensure_distinct_cookies(owner_cookie_key, viewer_cookie_key)
-
-    owner_response = _fetch_with_cookie(url, owner_cookie_key)
+def owner_verdict(
+    url: str, owner_cookie_key: str, owner_response: dict, *, check_answer_collapse: bool
+) -> Optional[bool]:
+    """True if the owner's own view already shows censorship, None to ask the viewer."""
     if response_not_found(owner_response):
         raise RuntimeError(
             f"Owner cookie {owner_cookie_key} cannot see {url}; "
@@ -109,25 +183,28 @@ def content_censored_check(
         )
     raise_for_unexpected_error(owner_response)
     if check_answer_collapse and answer_collapsed(owner_response):
-        print(url)
         return True
+    return None
+
 
-    viewer_response = _fetch_with_cookie(url, viewer_cookie_key)
+def viewer_verdict(
+    viewer_response: dict, *, check_answer_collapse: bool, check_article_reaction: bool
+) -> bool:
     if response_not_found(viewer_response):
-        print(url)
         return True
     raise_for_unexpected_error(viewer_response)
     if check_answer_collapse and answer_collapsed(viewer_response):
-        print(url)
         return True
     if check_article_reaction and article_reaction_hidden(viewer_response):
-        print(url)
         return True
     return False
 
 
-def cookie_keys_for_content(data: dict) -> tuple[str, str]:
-    author_name = author_name_for_content(data)
+def cookie_keys_for_content(document: dict) -> tuple[str, str]:
+    """Owner and viewer cookie keys for a document's Catalog row."""
+    author_name = document["author"]
+    if not author_name:
+        raise RuntimeError(f"Cannot determine cookie for author: {author_name}")
     return cookie_key_for_author(author_name), viewer_cookie_key_for_author(author_name)
 
 
@@ -137,56 +214,186 @@ def load_json_ordered(file_path):
 
 
 def save_censorship(payload: OrderedDict) -> None:
-    """Persist progress after each check so interrupted runs keep their state."""
     tmp_path = _CENSORSHIP_PATH.with_suffix(".tmp")
     with open(tmp_path, "w", encoding="utf-8") as f:
         json.dump(payload, f, ensure_ascii=False, indent=4)
         f.write("\n")
+        f.flush()
+        os.fsync(f.fileno())
     tmp_path.replace(_CENSORSHIP_PATH)
 
 
-def sleep_between_requests(sleep_min: float, sleep_max: float) -> None:
-    if sleep_max <= 0:
-        return
-    time.sleep(random.uniform(sleep_min, sleep_max))
+def replay_journal(censorship: OrderedDict, journal_path: Path = _JOURNAL_PATH) -> int:
+    """Apply verdicts journaled since the last compaction; returns how many.
+
+    A torn last line from a crash mid-write is ignored.
+    """
+    if not journal_path.exists():
+        return 0
+    replayed = 0
+    with open(journal_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            censorship[entry["path"]] = entry["censored"]
+            replayed += 1
+    return replayed
+
 
+def load_censorship() -> OrderedDict:
+    censorship = load_json_ordered(_CENSORSHIP_PATH)
+    replayed = replay_journal(censorship)
+    if replayed:
+        print(f"Replayed {replayed} journaled verdicts")
+    return censorship
 
-def answer_files_to_check(censorship: OrderedDict, refresh_all: bool) -> list[Path]:
-    files = sorted(Path("answer").glob("*.json"))
+
+class CensorshipJournal:
+    """Append-only progress log, compacted into censorship.json now and then.
+
+    Each verdict costs one appended line instead of a rewrite of the whole
+    file. Compaction saves censorship.json first and only then empties the
+    journal, so a crash in between merely replays verdicts already saved.
+    """
+
+    def __init__(self, path: Path = _JOURNAL_PATH, compact_every: int = 500) -> None:
+        self.path = path
+        self.compact_every = compact_every
+        self.pending = 0
+        self.file = open(path, "a", encoding="utf-8")
+
+    def record(self, path: str, censored: bool) -> None:
+        entry = {"path": path, "censored": censored, "checked": round(time.time(), 3)}
+        self.file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.file.flush()
+        self.pending += 1
+
+    def due(self) -> bool:
+        return self.pending >= self.compact_every
+
+    def compact(self, censorship: OrderedDict) -> None:
+        save_censorship(censorship)
+        self.file.truncate(0)
+        self.pending = 0
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def answer_stems_to_check(corpus: Corpus, censorship: OrderedDict, refresh_all: bool) -> list[str]:
+    stems = sorted(corpus.stems("answer"))
     if refresh_all:
-        return files
-    return [file for file in files if f"/answer/{file.stem}" not in censorship]
+        return stems
+    return [stem for stem in stems if f"/answer/{stem}" not in censorship]
 
 
-def article_files_to_check(censorship: OrderedDict, refresh_all: bool) -> list[Path]:
-    files = sorted(Path("article").glob("*.json"))
+def article_stems_to_check(corpus: Corpus, censorship: OrderedDict, refresh_all: bool) -> list[str]:
+    stems = sorted(corpus.stems("article"))
     if refresh_all:
-        return files
-    return [file for file in files if f"/p/{file.stem}" not in censorship]
+        return stems
+    return [stem for stem in stems if f"/p/{stem}" not in censorship]
+
+
+@dataclass(frozen=True)
+class Check:
+    path: str
+    url: str
+    owner_cookie_key: str
+    viewer_cookie_key: str
+    check_answer_collapse: bool = False
+    check_article_reaction: bool = False
+    created: float = 0
+
+    def owner_verdict(self, owner_response: dict) -> Optional[bool]:
+        """True if the owner's view already shows censorship, None to ask the viewer."""
+        return owner_verdict(
+            self.url,
+            self.owner_cookie_key,
+            owner_response,
+            check_answer_collapse=self.check_answer_collapse,
+        )
+
+    def viewer_verdict(self, viewer_response: dict) -> bool:
+        return viewer_verdict(
+            viewer_response,
+            check_answer_collapse=self.check_answer_collapse,
+            check_article_reaction=self.check_article_reaction,
+        )
 
 
-def check_answer(file: Path, censorship: OrderedDict) -> None:
-    data = load_json_ordered(file)
-    owner_cookie_key, viewer_cookie_key = cookie_keys_for_content(data)
-    censorship[f"/answer/{file.stem}"] = content_censored_check(
-        f"https://www.zhihu.com/api/v4/answers/{file.stem}?include={ANSWER_INCLUDE}",
+def answer_check(document: dict, api_base: str = API_BASE) -> Check:
+    stem = document["stem"]
+    owner_cookie_key, viewer_cookie_key = cookie_keys_for_content(document)
+    return Check(
+        f"/answer/{stem}",
+        f"{api_base}/api/v4/answers/{stem}?include={ANSWER_INCLUDE}",
         owner_cookie_key,
         viewer_cookie_key,
         check_answer_collapse=True,
+        created=document["created"] or 0,
     )
 
 
-def check_article(file: Path, censorship: OrderedDict) -> None:
-    data = load_json_ordered(file)
-    owner_cookie_key, viewer_cookie_key = cookie_keys_for_content(data)
-    censorship[f"/p/{file.stem}"] = content_censored_check(
-        f"https://www.zhihu.com/api/v4/articles/{file.stem}",
+def article_check(document: dict, api_base: str = API_BASE) -> Check:
+    stem = document["stem"]
+    owner_cookie_key, viewer_cookie_key = cookie_keys_for_content(document)
+    return Check(
+        f"/p/{stem}",
+        f"{api_base}/api/v4/articles/{stem}",
         owner_cookie_key,
         viewer_cookie_key,
         check_article_reaction=True,
+        created=document["created"] or 0,
     )
 
 
+def run_checks(checks: list[Check], prober: Prober, workers: int) -> Iterator[tuple[Check, bool]]:
+    """Yield (check, verdict) as checks complete.
+
+    Probes of many checks run in parallel on a pool of ``workers`` threads;
+    each cookie's token bucket paces its own requests. The viewer is only
+    asked once the owner's view leaves the verdict open, so an item the
+    owner already sees censored costs one request.
+    """
+    for owner_cookie_key, viewer_cookie_key in {
+        (check.owner_cookie_key, check.viewer_cookie_key) for check in checks
+    }:
+        ensure_distinct_cookies(owner_cookie_key, viewer_cookie_key, prober)
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    remaining = iter(checks)
+    in_flight: dict[Future, tuple[Check, str]] = {}
+    try:
+        while True:
+            # Queue a little ahead so that both cookies always have work.
+            while len(in_flight) < workers * 2:
+                check = next(remaining, None)
+                if check is None:
+                    break
+                future = executor.submit(prober.fetch, check.url, check.owner_cookie_key)
+                in_flight[future] = (check, "owner")
+            if not in_flight:
+                return
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                check, role = in_flight.pop(future)
+                if role == "owner":
+                    verdict = check.owner_verdict(future.result())
+                    if verdict is None:
+                        future = executor.submit(prober.fetch, check.url, check.viewer_cookie_key)
+                        in_flight[future] = (check, "viewer")
+                        continue
+                else:
+                    verdict = check.viewer_verdict(future.result())
+                if verdict:
+                    print(check.url)
+                yield check, verdict
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="检查知乎归档内容是否被屏蔽。")
     parser.add_argument(
@@ -207,52 +414,165 @@ def parse_args() -> argparse.Namespace:
         help="从排序后的文件列表第几个开始检查，用于恢复中断任务；0 表示从头开始。",
     )
     parser.add_argument(
-        "--sleep-min",
+        "--budget",
+        type=int,
+        default=0,
+        help="本次最多检查多少条：先检查从未检查过的条目，其余按优先级挑选（较新的内容、结果曾经变化过的、尚未复查过的、"
+        "距上次检查最久的优先）。0 表示不限制（默认）。",
+    )
+    parser.add_argument(
+        "--history",
+        type=Path,
+        default=HISTORY_PATH,
+        help=f"记录每条内容检查时间与结果变化次数的数据库（默认：{HISTORY_PATH}）。",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="同时进行的请求数上限（默认：4）。",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=0.5,
+        help="每个 Cookie 每秒请求数上限，作者与旁观者 Cookie 分别限速（默认：0.5）。设为 0 可关闭限速。",
+    )
+    parser.add_argument(
+        "--compact-every",
+        type=int,
+        default=500,
+        help="每记录多少条结果就把进度日志 censorship.jsonl 合并进 censorship.json（默认：500）。",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="使用本地模拟的 api/v4 接口和假 Cookie 运行，不写入 censorship.json，用于离线测量吞吐量。",
+    )
+    parser.add_argument(
+        "--cache",
+        type=Path,
+        default=CACHE_PATH,
+        help=f"记录接口响应的 SQLite 缓存（默认：{CACHE_PATH}），按 URL 与 Cookie 区分。",
+    )
+    parser.add_argument(
+        "--cache-ttl",
         type=float,
-        default=1,
-        help="请求之间的最短等待秒数（默认：1）。",
+        default=0.0,
+        help="直接使用多少小时内缓存的响应而不发请求（默认：0，即总是请求，只记录）。",
+    )
+    parser.add_argument(
+        "--replay",
+        action="store_true",
+        help="完全离线运行：只使用缓存中的响应（不论新旧），缺失时报错，用于快速重新判定。",
     )
     parser.add_argument(
-        "--sleep-max",
+        "--mock-latency",
         type=float,
-        default=3,
-        help="请求之间的最长等待秒数（默认：3）。设为 0 可关闭等待。",
+        default=0.3,
+        help="--dry-run 时模拟接口每次响应的延迟秒数（默认：0.3）。",
     )
     args = parser.parse_args()
-    if args.sleep_min < 0 or args.sleep_max < 0:
-        parser.error("--sleep-min and --sleep-max must be non-negative")
-    if args.sleep_max and args.sleep_min > args.sleep_max:
-        parser.error("--sleep-min must not exceed --sleep-max")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.rate < 0 or args.mock_latency < 0 or args.cache_ttl < 0:
+        parser.error("--rate, --mock-latency and --cache-ttl must be non-negative")
+    if args.dry_run and args.replay:
+        parser.error("--dry-run and --replay are mutually exclusive")
+    if args.compact_every < 1:
+        parser.error("--compact-every must be at least 1")
     if args.start_index < 0:
         parser.error("--start-index must be non-negative")
+    if args.budget < 0:
+        parser.error("--budget must be non-negative")
+    if args.budget and (args.start_index or args.refresh_all):
+        parser.error("--budget already considers every item; drop --start-index and --refresh-all")
     return args
 
 
 def main() -> None:
+    load_dotenv()
     args = parse_args()
-    censorship = load_json_ordered("censorship.json")
-
+    censorship = load_censorship()
+
+    server = None
+    api_base = API_BASE
+    cache = None
+    if args.dry_run:
+        server, api_base = serve_mock_api(args.mock_latency)
+    else:
+        cache = ResponseCache(args.cache, ttl=args.cache_ttl * 3600, replay=args.replay)
+
+    # A budgeted run ranks every local item and picks the most urgent ones.
+    refresh_all = args.refresh_all or bool(args.budget)
+    corpus = open_corpus()
+    # Authors and dates come from the catalog, so document bodies are not decoded.
+    catalog = Catalog()
+    catalog.refresh(corpus)
+    checks = []
     if args.content in ("all", "answers"):
-        answer_files = answer_files_to_check(censorship, args.refresh_all)
+        answer_stems = answer_stems_to_check(corpus, censorship, refresh_all)
         if args.start_index:
-            answer_files = answer_files[args.start_index :]
-        print(f"Checking {len(answer_files)} answers")
-        for file in tqdm(answer_files):
-            check_answer(file, censorship)
-            save_censorship(censorship)
-            sleep_between_requests(args.sleep_min, args.sleep_max)
+            answer_stems = answer_stems[args.start_index :]
+        print(f"Checking {len(answer_stems)} answers")
+        documents = {document["stem"]: document for document in catalog.documents("answer")}
+        checks.extend(answer_check(documents[stem], api_base) for stem in answer_stems)
 
     if args.content in ("all", "articles"):
-        article_files = article_files_to_check(censorship, args.refresh_all)
+        article_stems = article_stems_to_check(corpus, censorship, refresh_all)
         if args.start_index:
-            article_files = article_files[args.start_index :]
-        print(f"Checking {len(article_files)} articles")
-        for file in tqdm(article_files):
-            check_article(file, censorship)
-            save_censorship(censorship)
-            sleep_between_requests(args.sleep_min, args.sleep_max)
-
-    save_censorship(censorship)
+            article_stems = article_stems[args.start_index :]
+        print(f"Checking {len(article_stems)} articles")
+        documents = {document["stem"]: document for document in catalog.documents("article")}
+        checks.extend(article_check(documents[stem], api_base) for stem in article_stems)
+    catalog.close()
+    corpus.close()
+
+    history = CheckHistory(args.history)
+    if args.budget:
+        by_path = {check.path: check for check in checks}
+        chosen = schedule(
+            ((check.path, check.created) for check in checks), set(censorship), history, args.budget
+        )
+        checks = [by_path[path] for path in chosen]
+        print(f"Scheduled {len(checks)} of {len(by_path)} items")
+
+    journal = None
+    if not args.dry_run:
+        journal = CensorshipJournal(compact_every=args.compact_every)
+        # Folds in verdicts left over by an interrupted run and drops any torn line.
+        journal.compact(censorship)
+
+    prober = make_prober(args, cache)
+    # Verdicts are applied in list order so censorship.json keeps the serial ordering.
+    verdicts: dict[str, bool] = {}
+    applied = 0
+    started = time.monotonic()
+    try:
+        for check, verdict in tqdm(run_checks(checks, prober, args.workers), total=len(checks)):
+            verdicts[check.path] = verdict
+            while applied < len(checks) and checks[applied].path in verdicts:
+                path = checks[applied].path
+                censorship[path] = verdicts.pop(path)
+                applied += 1
+                if journal is not None:
+                    journal.record(path, censorship[path])
+                    history.record(path, censorship[path])
+            if journal is not None and journal.due():
+                journal.compact(censorship)
+    finally:
+        prober.close()
+        if server is not None:
+            server.shutdown()
+        if journal is not None:
+            journal.compact(censorship)
+            journal.close()
+        history.close()
+        if cache is not None:
+            cache.close()
+
+    elapsed = time.monotonic() - started
+    print(f"Checked {len(checks)} items in {elapsed:.1f}s ({len(checks) / max(elapsed, 1e-9):.2f}/s)")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,35 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at ``rate`` tokens per second.
+
+    At most ``burst`` tokens accumulate while idle. A rate of 0 disables
+    limiting, which is handy against a local stub server.
+    """
+
+    def __init__(self, rate: float, burst: float = 1) -> None:
+        if rate < 0:
+            raise ValueError("rate must not be negative")
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until a token is available and take it."""
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                elapsed = now - self._updated
+                self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
@@ -0,0 +1,96 @@
+import math
+import sqlite3
+import time
+from pathlib import Path
+from typing import Iterable, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checks (
+    path TEXT PRIMARY KEY,
+    verdict INTEGER NOT NULL,
+    checks INTEGER NOT NULL DEFAULT 1,
+    flips INTEGER NOT NULL DEFAULT 0,
+    checked REAL NOT NULL
+);
+"""
+DAY = 24 * 60 * 60
+# Items with no recorded check count as this stale.
+MAX_STALENESS_DAYS = 365
+# Content this many days old weighs half as much as content published today.
+CONTENT_HALF_LIFE_DAYS = 180
+FLIP_WEIGHT = 2
+NEVER_RECHECKED_WEIGHT = 2
+
+
+class CheckHistory:
+    """When each path was last checked and how often its verdict flipped."""
+
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def record(self, path: str, verdict: bool, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO checks (path, verdict, checked) VALUES (?, ?, ?)"
+                " ON CONFLICT (path) DO UPDATE SET checks = checks + 1,"
+                " flips = flips + (verdict != excluded.verdict),"
+                " verdict = excluded.verdict, checked = excluded.checked",
+                (path, int(verdict), now),
+            )
+
+    def entries(self) -> dict[str, tuple[int, int, float]]:
+        """Map each path to (checks, flips, last checked)."""
+        return {
+            path: (checks, flips, checked)
+            for path, checks, flips, checked in self.conn.execute(
+                "SELECT path, checks, flips, checked FROM checks"
+            )
+        }
+
+
+def recheck_priority(
+    created: float,
+    entry: Optional[tuple[int, int, float]],
+    now: float,
+) -> float:
+    """Higher for stale, recent, previously flipped and never re-checked items."""
+    checks, flips, checked = entry if entry else (1, 0, 0.0)
+    staleness = min((now - checked) / DAY, MAX_STALENESS_DAYS)
+    age = max(now - created, 0) / DAY
+    priority = staleness * (1 + math.pow(2, -age / CONTENT_HALF_LIFE_DAYS))
+    priority *= 1 + FLIP_WEIGHT * flips
+    if checks < 2:
+        priority *= NEVER_RECHECKED_WEIGHT
+    return priority
+
+
+def schedule(
+    items: Iterable[tuple[str, float]],
+    known: set[str],
+    history: CheckHistory,
+    budget: int,
+    now: Optional[float] = None,
+) -> list[str]:
+    """Pick up to ``budget`` paths from (path, created) pairs.
+
+    Paths missing from ``known`` have no verdict yet and always come first, in
+    input order; the rest follow by descending ``recheck_priority``.
+    """
+    now = time.time() if now is None else now
+    entries = history.entries()
+    unchecked = []
+    ranked = []
+    for path, created in items:
+        if path not in known:
+            unchecked.append(path)
+        else:
+            ranked.append((-recheck_priority(created, entries.get(path), now), path))
+    ranked.sort()
+    return (unchecked + [path for _, path in ranked])[:budget]
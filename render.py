@@ -1,28 +1,45 @@
+import argparse
+import hashlib
 import json
+import os
 import re
+import sqlite3
+import zlib
+from concurrent.futures import Executor
+from contextlib import ExitStack
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Optional
 from datetime import datetime
 from html import escape
-from tqdm import tqdm
-from feedgen.feed import FeedGenerator
 import zoneinfo
-from bs4 import BeautifulSoup
+
+from catalog import Catalog
+from corpus import SOURCE_DIRS, Corpus, archived_stems, open_corpus, shared_corpus
+from links import LinkIndex, LinkStats
+from plaintext import TextCache, plain_text
+from rewrite import Citation, rewrite_content
 
 
 BASE_URL = "https://l-m-sherlock.github.io/ZhiHuArchive"
+HTML_DIR = Path("html")
+CACHE_DIR = Path(".cache") / "render"
+MANIFEST_PATH = CACHE_DIR / "manifest.json"
+LINK_STATS_PATH = CACHE_DIR / "link-stats.json"
+RSS_CACHE_DIR = CACHE_DIR / "rss"
+FRAGMENTS_PATH = CACHE_DIR / "fragments.sqlite3"
+# Bump when render.py changes how bodies, references or meta descriptions are derived.
+FRAGMENT_VERSION = "1"
+
+_link_index: Optional[LinkIndex] = None
 
-article_ids = [file.stem for file in Path("./article").glob("*.json")]
-answer_ids = [file.stem for file in Path("./answer").glob("*.json")]
 
-fg = FeedGenerator()
-fg.id(f"{BASE_URL}/feed.xml")
-fg.title("Thoughts Memo")
-fg.link(href=f"{BASE_URL}/", rel="self")
-fg.description("知乎账号 @Thoughts Memo 和 @Jarrett Ye 的文章和回答的存档")
-fg.language("zh-Hans")
-fg.generator("feedgen", uri="https://github.com/lkiesow/python-feedgen")
-fg.icon(f"{BASE_URL}/favicon.ico")
-fg.logo(f"{BASE_URL}/favicon.ico")
+def link_index() -> LinkIndex:
+    """Index of archived pages, built on first use so importing render is cheap."""
+    global _link_index
+    if _link_index is None:
+        _link_index = LinkIndex.from_ids(archived_stems("article"), archived_stems("answer"))
+    return _link_index
 
 
 def archive_url(stem: str) -> str:
@@ -35,77 +52,51 @@ def source_url(data: dict, stem: str) -> str:
     return f"https://zhuanlan.zhihu.com/p/{stem}"
 
 
-def add_item(data, full_html):
-    created_timestamp = datetime.fromtimestamp(
-        data["created"] if "created" in data else data["created_time"],
-        zoneinfo.ZoneInfo("Asia/Shanghai"),
-    )
-    title = data["question"]["title"] if "question" in data else data["title"]
-    fe = fg.add_entry()
-    fe.title(title)
-    fe.link(href=archive_url(file.stem), rel="alternate")
-    fe.link(href=source_url(data, file.stem), rel="related")
-    fe.content(full_html, type="html")
-    fe.summary(strip_html_tags(data.get("excerpt", "")))
-    fe.published(created_timestamp)
-    fe.guid(archive_url(file.stem))
-
-
-def replace_url(url: str) -> str:
-    _id = url.split("/")[-1]
-    if _id in article_ids or _id in answer_ids:
-        return f"./{_id}.html"
-    return url
+def feed_entry(data: dict, stem: str) -> dict:
+    created = data["created"] if "created" in data else data["created_time"]
+    return {
+        "stem": stem,
+        "title": data["question"]["title"] if "question" in data else data["title"],
+        "created": created,
+        "updated": data.get("updated") or data.get("updated_time") or created,
+        "source_url": source_url(data, stem),
+        "summary": strip_html_tags(data.get("excerpt", "")),
+    }
+
+
+@dataclass(frozen=True)
+class ProcessedContent:
+    """A document body after one parse: rewritten HTML plus the parts derived from it."""
+
+    html: str
+    reference: str
+    text: str
+
+
+def process_content(content: str, key: str) -> ProcessedContent:
+    """Rewrite ``content`` in one streaming pass and derive what the templates need.
+
+    ``key`` names the document field for the plain-text cache.
+    """
+    html, citations = rewrite_content(content, link_index().resolve)
+    # Text of the rewritten page, where dropped <u> wrappers no longer split words.
+    text = plain_text(html, key)
+    return ProcessedContent(html=html, reference=reference_section(citations), text=text)
 
 
-def process_content(content: str) -> str:
-    # Parse HTML content
-    soup = BeautifulSoup(content, "html.parser")
-
-    # Process img tags
-    for img in soup.find_all("img"):
-        actualsrc = img.get("data-actualsrc")
-        if actualsrc:
-            img["src"] = actualsrc
-            del img["data-actualsrc"]
-
-    # Process anchor tags
-    for a in soup.find_all("a"):
-        href = a.get("href")
-        if href and href.startswith("https://link.zhihu.com/"):
-            try:
-                # Convert relative URL to absolute
-                full_url = "https:" + href if href.startswith("//") else href
-                from urllib.parse import urlparse, parse_qs
-
-                parsed = urlparse(full_url)
-                target = parse_qs(parsed.query).get("target", [None])[0]
-                if target:
-                    decoded_target = target.replace("https%3A", "https:").replace(
-                        "http%3A", "http:"
-                    )
-                    a["href"] = replace_url(decoded_target)
-            except Exception as e:
-                print(f"Failed to parse URL {href}: {e}")
-                continue
-        elif href:
-            a["href"] = replace_url(href)
-
-        # Ensure links open in a new tab safely.
-        rel_attr = a.get("rel", [])
-        rel_values = rel_attr.split() if isinstance(rel_attr, str) else list(rel_attr)
-        for value in ("noopener", "noreferrer"):
-            if value not in rel_values:
-                rel_values.append(value)
-        if rel_values:
-            a["rel"] = rel_values
-        a["target"] = "_blank"
-
-    # Remove u tags but keep their contents
-    for u in soup.find_all("u"):
-        u.unwrap()
-
-    return str(soup)
+@dataclass(frozen=True)
+class Fragments:
+    """The costly parts of a page, which depend only on its document and the link index.
+
+    ``question`` is None for articles and answers without a question detail;
+    ``links`` counts the links resolved while building the fragments.
+    """
+
+    content: str
+    reference: str
+    question: Optional[str]
+    meta_description: str
+    links: LinkStats
 
 
 def strip_html_tags(value: str) -> str:
@@ -113,10 +104,7 @@ def strip_html_tags(value: str) -> str:
 
 
 def clean_text(value: str) -> str:
-    if not value:
-        return ""
-    text = BeautifulSoup(str(value), "html.parser").get_text(" ", strip=True)
-    return re.sub(r"\s+", " ", text).strip()
+    return plain_text(str(value)) if value else ""
 
 
 def truncate_text(value: str, max_length: int = 160) -> str:
@@ -126,9 +114,9 @@ def truncate_text(value: str, max_length: int = 160) -> str:
 
 
 def build_meta_description(primary: str, *fallbacks: str) -> str:
+    """Build a description from plain-text parts, as produced by clean_text."""
     parts = []
-    for value in (primary, *fallbacks):
-        text = clean_text(value)
+    for text in (primary, *fallbacks):
         if text and text not in parts:
             parts.append(text)
 
@@ -214,19 +202,10 @@ def normalize_author_url(url: str) -> str:
     return url
 
 
-def extract_reference(html: str) -> str:
-    # Parse HTML with BeautifulSoup
-    soup = BeautifulSoup(html, "html.parser")
+def reference_section(citations: list[Citation]) -> str:
     references = {}
-
-    # Find all sup elements and collect references
-    for sup in soup.find_all("sup"):
-        text = sup.get("data-text")
-        url = sup.get("data-url")
-        numero = sup.get("data-numero")
-
-        if text and url and numero:
-            references[numero] = {"text": text, "url": replace_url(url)}
+    for numero, text, url in citations:
+        references[numero] = {"text": text, "url": link_index().resolve(url)}
 
     # Generate reference list if any references were found
     if references:
@@ -239,8 +218,31 @@ def extract_reference(html: str) -> str:
     return ""
 
 
+PLACEHOLDER_PATTERN = re.compile(r'\$\{"(\w+)"\}')
+
+
+class Template:
+    """A ``${"key"}`` template compiled once into literal text and slots.
+
+    Indentation is stripped from the template text at compile time only, so
+    inserted values such as ``<pre>`` blocks keep their whitespace.
+    """
+
+    def __init__(self, source: str) -> None:
+        parts = PLACEHOLDER_PATTERN.split(source)
+        self._literals = [part.replace("    ", "") for part in parts[0::2]]
+        self._keys = parts[1::2]
+
+    def render(self, context: dict) -> str:
+        pieces = [self._literals[0]]
+        for key, literal in zip(self._keys, self._literals[1:]):
+            pieces.append(context[key])
+            pieces.append(literal)
+        return "".join(pieces)
+
+
 # Create HTML template
-article_template = """<!DOCTYPE html>
+article_template = Template("""<!DOCTYPE html>
 <html lang="zh">
 <head>
     <title>${"title"} | ZhiHu Archive</title>
@@ -378,9 +380,9 @@ article_template = """<!DOCTYPE html>
             async>
     </script>
 </body>
-</html>"""
+</html>""")
 
-rss_article_template = """<main>
+rss_article_template = Template("""<main>
 <header>
     <img class="origin_image" src="${"image_url"}"/>
 </header>
@@ -391,20 +393,38 @@ rss_article_template = """<main>
 <footer>
     <p>发表于 ${"created_time_formatted"}</p>
 </footer>
-</main>"""
+</main>""")
+
+
+def created_time_values(timestamp: int) -> tuple[str, str]:
+    created_time = datetime.fromtimestamp(timestamp)
+    return created_time.isoformat(), created_time.strftime("%Y年%m月%d日")
+
+
+def article_fragments(data: dict, stem: str) -> Fragments:
+    body = process_content(data["content"], f"article/{stem}/rendered-content")
+    meta_description = build_meta_description(
+        clean_text(data.get("excerpt", "")),
+        body.text,
+    )
+    return Fragments(
+        content=body.html,
+        reference=body.reference,
+        question=None,
+        meta_description=meta_description,
+        links=link_index().take_stats(),
+    )
 
 
-def fill_article_template(data: dict, is_rss: bool = False) -> str:
-    template = rss_article_template if is_rss else article_template
-    archive_url_value = archive_url(file.stem)
-    source_url_value = source_url(data, file.stem)
+def article_context(data: dict, stem: str, fragments: Fragments) -> dict:
+    """Compute every template value once; the HTML and RSS variants share it."""
+    created_time_str, created_time_formatted = created_time_values(data["created"])
+    archive_url_value = archive_url(stem)
+    source_url_value = source_url(data, stem)
     author_url_value = normalize_author_url(data["author"].get("url", ""))
     title = clean_text(data["title"])
     author_name = clean_text(data["author"]["name"])
-    meta_description = build_meta_description(
-        data.get("excerpt", ""),
-        data.get("content", ""),
-    )
+    meta_description = fragments.meta_description
     json_ld = json_ld_script(
         article_schema(
             title=title,
@@ -417,68 +437,47 @@ def fill_article_template(data: dict, is_rss: bool = False) -> str:
             image_url=data.get("image_url", ""),
         )
     )
-    return (
-        template.replace('${"title"}', html_attr(title))
-        .replace('${"archive_url"}', html_attr(archive_url_value))
-        .replace('${"source_url"}', html_attr(source_url_value))
-        .replace('${"meta_description"}', html_attr(meta_description))
-        .replace('${"json_ld"}', json_ld)
-        .replace('${"redirect"}', "false")
-        .replace('${"image_url"}', html_attr(data["image_url"]))
-        .replace('${"avatar_url"}', html_attr(data["author"]["avatar_url"]))
-        .replace('${"author_url"}', html_attr(author_url_value))
-        .replace('${"author"}', html_attr(author_name))
-        .replace('${"headline"}', html_attr(clean_text(data["author"]["headline"])))
-        .replace('${"created_time"}', html_attr(created_time_str))
-        .replace('${"created_time_formatted"}', html_attr(created_time_formatted))
-        .replace('${"voteup_count"}', str(data["voteup_count"]))
-        .replace('${"comment_count"}', str(data["comment_count"]))
-        .replace('${"content"}', data["content"])
-        .replace('${"reference"}', extract_reference(data["content"]))
-        .replace(
-            '${"column_title"}',
-            html_attr(data.get("column", {}).get("title", "无")),
-        )
-        .replace(
-            '${"column_description"}',
-            html_attr(data.get("column", {}).get("description", "")),
-        )
-        .replace("    ", "")
-    )
-
-
-Path("html").mkdir(exist_ok=True)
-
-for file in tqdm(list(Path("article").glob("*.json"))):
-    with open(file, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
-    # Format the created timestamp
-    created_time = datetime.fromtimestamp(data["created"])
-    created_time_str = created_time.isoformat()
-    created_time_formatted = created_time.strftime("%Y年%m月%d日")
-
-    data["content"] = process_content(data["content"])
+    return {
+        "title": html_attr(title),
+        "archive_url": html_attr(archive_url_value),
+        "source_url": html_attr(source_url_value),
+        "meta_description": html_attr(meta_description),
+        "json_ld": json_ld,
+        "redirect": "false",
+        "image_url": html_attr(data["image_url"]),
+        "avatar_url": html_attr(data["author"]["avatar_url"]),
+        "author_url": html_attr(author_url_value),
+        "author": html_attr(author_name),
+        "headline": html_attr(clean_text(data["author"]["headline"])),
+        "created_time": html_attr(created_time_str),
+        "created_time_formatted": html_attr(created_time_formatted),
+        "voteup_count": str(data["voteup_count"]),
+        "comment_count": str(data["comment_count"]),
+        "content": fragments.content,
+        "reference": fragments.reference,
+        "column_title": html_attr(data.get("column", {}).get("title", "无")),
+        "column_description": html_attr(
+            data.get("column", {}).get("description", "")
+        ),
+    }
 
-    # Prepare the HTML content
-    html_content = fill_article_template(data)
-    # Write the rendered HTML to file
-    output_file = Path("html") / f"{file.stem}.html"
-    with open(output_file, "w", encoding="utf-8") as f:
-        f.write(html_content)
 
-    rss_content = fill_article_template(data, is_rss=True)
+def render_article(data: dict, stem: str, fragments: Fragments) -> tuple[str, str]:
+    context = article_context(data, stem, fragments)
+    return (
+        article_template.render(context),
+        rss_article_template.render(context),
+    )
 
-    add_item(data, rss_content)
 
-question_template = """<div style="margin: 0; padding: 0.5em 1em; border-left: 4px solid #999; font-size: 0.86em; background: #f9f9f9;">
+question_template = Template("""<div style="margin: 0; padding: 0.5em 1em; border-left: 4px solid #999; font-size: 0.86em; background: #f9f9f9;">
 <h2>问题描述</h2>
 ${"question"}
 </div>
-<hr>"""
+<hr>""")
 
 
-answer_template = """<!DOCTYPE html>
+answer_template = Template("""<!DOCTYPE html>
 <html lang="zh">
 <head>
     <title>${"title"} - @${"author"} | ZhiHu Archive</title>
@@ -606,9 +605,9 @@ answer_template = """<!DOCTYPE html>
             async>
     </script>
 </body>
-</html>"""
+</html>""")
 
-rss_answer_template = """<main>
+rss_answer_template = Template("""<main>
 <article>
     ${"question"}
     ${"content"}
@@ -626,29 +625,45 @@ rss_answer_template = """<main>
         </div>
     </div>
 </footer>
-</main>"""
+</main>""")
 
 
-def fill_answer_template(data: dict, is_rss: bool = False) -> str:
-    template = rss_answer_template if is_rss else answer_template
+def answer_fragments(data: dict, stem: str) -> Fragments:
+    body = process_content(data["content"], f"answer/{stem}/rendered-content")
     question_detail = data["question"].get("detail", "")
-    question_block = ""
+    question_html = None
+    question_text = ""
     if question_detail and question_detail.strip():
-        question_block = question_template.replace(
-            '${"question"}',
-            process_content(question_detail),
-        )
-    archive_url_value = archive_url(file.stem)
-    source_url_value = source_url(data, file.stem)
+        question = process_content(question_detail, f"answer/{stem}/rendered-detail")
+        question_html = question.html
+        question_text = question.text
+    meta_description = build_meta_description(
+        clean_text(data.get("excerpt", "")),
+        clean_text(data["question"].get("title", "")),
+        question_text,
+        body.text,
+    )
+    return Fragments(
+        content=body.html,
+        reference=body.reference,
+        question=question_html,
+        meta_description=meta_description,
+        links=link_index().take_stats(),
+    )
+
+
+def answer_context(data: dict, stem: str, fragments: Fragments) -> dict:
+    """Answer counterpart of article_context."""
+    question_block = ""
+    if fragments.question is not None:
+        question_block = question_template.render({"question": fragments.question})
+    created_time_str, created_time_formatted = created_time_values(data["created_time"])
+    archive_url_value = archive_url(stem)
+    source_url_value = source_url(data, stem)
     author_url_value = normalize_author_url(data["author"].get("url", ""))
     title = clean_text(data["question"]["title"])
     author_name = clean_text(data["author"]["name"])
-    meta_description = build_meta_description(
-        data.get("excerpt", ""),
-        data["question"].get("title", ""),
-        question_detail,
-        data.get("content", ""),
-    )
+    meta_description = fragments.meta_description
     json_ld = json_ld_script(
         article_schema(
             title=title,
@@ -660,53 +675,333 @@ def fill_answer_template(data: dict, is_rss: bool = False) -> str:
             modified_timestamp=data.get("updated_time") or data["created_time"],
         )
     )
+    return {
+        "title": html_attr(title),
+        "archive_url": html_attr(archive_url_value),
+        "source_url": html_attr(source_url_value),
+        "meta_description": html_attr(meta_description),
+        "json_ld": json_ld,
+        "redirect": "false",
+        "avatar_url": html_attr(data["author"]["avatar_url"]),
+        "author_url": html_attr(author_url_value),
+        "author": html_attr(author_name),
+        "headline": html_attr(clean_text(data["author"]["headline"])),
+        "created_time": html_attr(created_time_str),
+        "created_time_formatted": html_attr(created_time_formatted),
+        "voteup_count": str(data["voteup_count"]),
+        "comment_count": str(data["comment_count"]),
+        "question": question_block,
+        "content": fragments.content,
+        "reference": fragments.reference,
+    }
+
+
+def render_answer(data: dict, stem: str, fragments: Fragments) -> tuple[str, str]:
+    context = answer_context(data, stem, fragments)
     return (
-        template.replace('${"title"}', html_attr(title))
-        .replace('${"archive_url"}', html_attr(archive_url_value))
-        .replace('${"source_url"}', html_attr(source_url_value))
-        .replace('${"meta_description"}', html_attr(meta_description))
-        .replace('${"json_ld"}', json_ld)
-        .replace('${"redirect"}', "false")
-        .replace('${"avatar_url"}', html_attr(data["author"]["avatar_url"]))
-        .replace('${"author_url"}', html_attr(author_url_value))
-        .replace('${"author"}', html_attr(author_name))
-        .replace('${"headline"}', html_attr(clean_text(data["author"]["headline"])))
-        .replace('${"created_time"}', html_attr(created_time_str))
-        .replace('${"created_time_formatted"}', html_attr(created_time_formatted))
-        .replace('${"voteup_count"}', str(data["voteup_count"]))
-        .replace('${"comment_count"}', str(data["comment_count"]))
-        .replace('${"question"}', question_block)
-        .replace('${"content"}', data["content"])
-        .replace('${"reference"}', extract_reference(data["content"]))
-        .replace("    ", "")
+        answer_template.render(context),
+        rss_answer_template.render(context),
     )
 
 
-for file in tqdm(list(Path("answer").glob("*.json"))):
-    with open(file, "r", encoding="utf-8") as f:
-        data = json.load(f)
+def fragment_version() -> str:
+    """Fingerprint of everything besides the source JSON that shapes a page's Fragments."""
+    digest = hashlib.sha256(FRAGMENT_VERSION.encode("utf-8"))
+    for name in ("links.py", "plaintext.py", "rewrite.py"):
+        digest.update(Path(__file__).with_name(name).read_bytes())
+    # Internal links are rewritten against the set of archived pages.
+    digest.update(link_index().version.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def render_version() -> str:
+    """Fingerprint of everything besides the source JSON that shapes a page."""
+    digest = hashlib.sha256(fragment_version().encode("utf-8"))
+    digest.update(Path(__file__).read_bytes())
+    return digest.hexdigest()
+
+
+class FragmentCache:
+    """Fragments in SQLite, keyed by source hash and fragment_version.
+
+    A template change re-renders every page but finds the fragments here.
+    Render worker processes share the file through ``shared_fragments``.
+    """
+
+    def __init__(self, path: Path = FRAGMENTS_PATH) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.version = fragment_version()
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # Losing recent entries in a crash only costs re-processing.
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS fragments ("
+            "source_hash TEXT NOT NULL, version TEXT NOT NULL, body BLOB NOT NULL,"
+            " PRIMARY KEY (source_hash, version))"
+        )
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def get(self, source_hash: str) -> Optional[Fragments]:
+        row = self.conn.execute(
+            "SELECT body FROM fragments WHERE source_hash = ? AND version = ?",
+            (source_hash, self.version),
+        ).fetchone()
+        if row is None:
+            return None
+        values = json.loads(zlib.decompress(row[0]))
+        links = LinkStats.from_dict(values.pop("links"))
+        return Fragments(**values, links=links)
+
+    def put(self, source_hash: str, fragments: Fragments) -> None:
+        values = {**vars(fragments), "links": vars(fragments.links)}
+        body = zlib.compress(json.dumps(values, ensure_ascii=False).encode("utf-8"))
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO fragments VALUES (?, ?, ?)",
+                (source_hash, self.version, body),
+            )
+
+    def prune(self, source_hashes: set[str]) -> int:
+        """Drop fragments of other versions or of sources no longer archived."""
+        stale = [
+            (source_hash, version)
+            for source_hash, version in self.conn.execute(
+                "SELECT source_hash, version FROM fragments"
+            )
+            if version != self.version or source_hash not in source_hashes
+        ]
+        with self.conn:
+            self.conn.executemany(
+                "DELETE FROM fragments WHERE source_hash = ? AND version = ?", stale
+            )
+        return len(stale)
+
+
+_fragments: Optional[tuple[int, FragmentCache]] = None
+
+
+def shared_fragments() -> FragmentCache:
+    """One FragmentCache per process, for render worker processes."""
+    global _fragments
+    if _fragments is None or _fragments[0] != os.getpid():
+        _fragments = (os.getpid(), FragmentCache())
+    return _fragments[1]
+
+
+def load_manifest() -> dict:
+    if not MANIFEST_PATH.exists():
+        return {}
+    try:
+        with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as exc:
+        print(f"Ignoring unreadable build manifest {MANIFEST_PATH}: {exc}")
+        return {}
 
-    if "error" in data:
-        print(data["error"], file.stem)
-        continue
 
-    # Format the created timestamp
-    created_time = datetime.fromtimestamp(data["created_time"])
-    created_time_str = created_time.isoformat()
-    created_time_formatted = created_time.strftime("%Y年%m月%d日")
+def save_manifest(manifest: dict) -> None:
+    MANIFEST_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = MANIFEST_PATH.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    tmp_path.replace(MANIFEST_PATH)
 
-    data["content"] = process_content(data["content"])
 
-    # Prepare the HTML content
-    html_content = fill_answer_template(data)
-    # Write the rendered HTML to file
-    output_file = Path("html") / f"{file.stem}.html"
-    with open(output_file, "w", encoding="utf-8") as f:
+RENDERERS = {"article": render_article, "answer": render_answer}
+FRAGMENT_BUILDERS = {"article": article_fragments, "answer": answer_fragments}
+
+
+def render_file(kind: str, stem: str, source_hash: str) -> Optional[tuple[dict, LinkStats]]:
+    """Render one document to disk; runs in worker processes with --jobs."""
+    data = shared_corpus().load(kind, stem)
+
+    if "error" in data:
+        print(data["error"], stem)
+        return None
+
+    cache = shared_fragments()
+    fragments = cache.get(source_hash)
+    if fragments is None:
+        fragments = FRAGMENT_BUILDERS[kind](data, stem)
+        cache.put(source_hash, fragments)
+    html_content, rss_content = RENDERERS[kind](data, stem, fragments)
+    with open(HTML_DIR / f"{stem}.html", "w", encoding="utf-8") as f:
         f.write(html_content)
+    with open(RSS_CACHE_DIR / f"{stem}.html", "w", encoding="utf-8") as f:
+        f.write(rss_content)
+    return feed_entry(data, stem), fragments.links
+
+
+def is_fresh(cached: Optional[dict], stem: str, source_hash: str, version: str) -> bool:
+    return bool(
+        cached
+        and cached["source_hash"] == source_hash
+        and cached["version"] == version
+        and "links" in cached
+        and (HTML_DIR / f"{stem}.html").exists()
+        and (RSS_CACHE_DIR / f"{stem}.html").exists()
+    )
+
+
+def build_pages(
+    kind: str,
+    corpus: Corpus,
+    catalog: Catalog,
+    manifest: dict,
+    documents: dict,
+    version: str,
+    link_stats: LinkStats,
+    executor: Optional[Executor] = None,
+) -> tuple[int, int]:
+    from tqdm import tqdm
+
+    stems = list(corpus.stems(kind))
+    # The catalog re-hashes only documents whose size or mtime changed.
+    source_hashes = catalog.hashes(kind)
+    stale = []
+    for stem in stems:
+        cached = manifest.get(stem)
+        if is_fresh(cached, stem, source_hashes[stem], version):
+            documents[stem] = cached
+            # Skipped pages still count towards the archive-wide link stats.
+            link_stats.merge(LinkStats.from_dict(cached["links"]))
+        else:
+            stale.append(stem)
+
+    kinds = [kind] * len(stale)
+    hashes = [source_hashes[stem] for stem in stale]
+    if executor is None:
+        results = map(render_file, kinds, stale, hashes)
+    else:
+        results = executor.map(render_file, kinds, stale, hashes, chunksize=8)
+
+    rendered = 0
+    for stem, result in zip(stale, tqdm(results, total=len(stale))):
+        if result is None:
+            continue
+        entry, stats = result
+        link_stats.merge(stats)
+        documents[stem] = {
+            "source_hash": source_hashes[stem],
+            "version": version,
+            "entry": entry,
+            "links": stats.to_dict(),
+        }
+        rendered += 1
+    return rendered, len(stems) - len(stale)
+
+
+def save_link_stats(stats: LinkStats) -> None:
+    with open(LINK_STATS_PATH, "w", encoding="utf-8") as f:
+        json.dump(stats.to_dict(), f, ensure_ascii=False, indent=4)
+
+
+def remove_stale_pages(manifest: dict, documents: dict) -> None:
+    for stem in manifest.keys() - documents.keys():
+        (HTML_DIR / f"{stem}.html").unlink(missing_ok=True)
+        (RSS_CACHE_DIR / f"{stem}.html").unlink(missing_ok=True)
 
-    rss_content = fill_answer_template(data, is_rss=True)
 
-    add_item(data, rss_content)
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="将文章和回答渲染为静态 HTML 页面。")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="忽略构建清单，重新渲染所有页面。",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="并行渲染的进程数（默认：1，即串行；0 表示使用全部 CPU 核心）。",
+    )
+    parser.add_argument(
+        "--feed-size",
+        type=int,
+        default=100,
+        help="feed.xml 中保留的最新条目数（默认：100）。",
+    )
+    parser.add_argument(
+        "--feed-archives",
+        action="store_true",
+        help="按 RFC 5005 将更早的条目写入分页归档 feed（feed-archive-N.xml）。",
+    )
+    args = parser.parse_args()
+    if args.jobs < 0:
+        parser.error("--jobs must be non-negative")
+    if args.feed_size < 1:
+        parser.error("--feed-size must be positive")
+    return args
+
+
+def main() -> None:
+    from concurrent.futures import ProcessPoolExecutor
+
+    from feed import AtomFeedWriter, write_feeds
+
+    args = parse_args()
+    HTML_DIR.mkdir(exist_ok=True)
+    RSS_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
+    previous = load_manifest()
+    manifest = {} if args.full else previous
+    version = render_version()
+    documents: dict = {}
+    link_stats = LinkStats()
+    rendered = skipped = 0
+    jobs = args.jobs or os.cpu_count() or 1
+    with ExitStack() as stack:
+        corpus = open_corpus()
+        stack.callback(corpus.close)
+        catalog = Catalog()
+        stack.callback(catalog.close)
+        catalog.refresh(corpus)
+        executor = None
+        if jobs > 1:
+            # Migrate the text cache here rather than in every worker at once.
+            TextCache().close()
+            executor = stack.enter_context(ProcessPoolExecutor(max_workers=jobs))
+        for kind in ("article", "answer"):
+            counts = build_pages(
+                kind, corpus, catalog, manifest, documents, version, link_stats, executor
+            )
+            rendered += counts[0]
+            skipped += counts[1]
+        shared_fragments().prune(
+            {source_hash for kind in SOURCE_DIRS for source_hash in catalog.hashes(kind).values()}
+        )
+
+    remove_stale_pages(previous, documents)
+    save_manifest(documents)
+    print(f"Rendered {rendered} pages, skipped {skipped} unchanged")
+    save_link_stats(link_stats)
+    print(
+        f"Links in all pages: {link_stats.hits} archived, "
+        f"{link_stats.misses} unresolved Zhihu links "
+        f"({len(link_stats.unresolved)} distinct), {link_stats.external} external"
+    )
+
+    # Generate RSS feed
+    writer = AtomFeedWriter(
+        base_url=BASE_URL,
+        title="Thoughts Memo",
+        subtitle="知乎账号 @Thoughts Memo 和 @Jarrett Ye 的文章和回答的存档",
+        language="zh-Hans",
+        load_content=lambda stem: (RSS_CACHE_DIR / f"{stem}.html").read_text(
+            encoding="utf-8"
+        ),
+    )
+    write_feeds(
+        writer,
+        HTML_DIR,
+        [document["entry"] for document in documents.values()],
+        size=args.feed_size,
+        archives=args.feed_archives,
+    )
+
 
-# Generate RSS feed
-fg.atom_file(Path("html") / "feed.xml")
+if __name__ == "__main__":
+    main()
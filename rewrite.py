@@ -0,0 +1,259 @@
+import re
+from collections import Counter
+from html.entities import html5
+from html.parser import HTMLParser
+from typing import Callable, List, Tuple
+
+# Serialization follows BeautifulSoup's html.parser builder and "minimal"
+# formatter, so pages stay byte-identical to those built from a parse tree.
+VOID_ELEMENTS = frozenset(
+    {
+        "area",
+        "base",
+        "br",
+        "col",
+        "embed",
+        "hr",
+        "img",
+        "input",
+        "keygen",
+        "link",
+        "menuitem",
+        "meta",
+        "param",
+        "source",
+        "track",
+        "wbr",
+        "basefont",
+        "bgsound",
+        "command",
+        "frame",
+        "image",
+        "isindex",
+        "nextid",
+        "spacer",
+    }
+)
+MULTI_VALUED_ATTRIBUTES = {
+    "*": {"class", "accesskey", "dropzone"},
+    "a": {"rel", "rev"},
+    "link": {"rel", "rev"},
+    "td": {"headers"},
+    "th": {"headers"},
+    "form": {"accept-charset"},
+    "object": {"archive"},
+    "area": {"rel"},
+    "icon": {"sizes"},
+    "iframe": {"sandbox"},
+    "output": {"for"},
+}
+MULTI_VALUED_BY_TAG = {
+    tag: names | MULTI_VALUED_ATTRIBUTES["*"] for tag, names in MULTI_VALUED_ATTRIBUTES.items()
+}
+PRESERVE_WHITESPACE_TAGS = frozenset({"pre", "textarea"})
+RAW_TEXT_TAGS = frozenset({"script", "style"})
+# Tags dropped from the output while their contents are kept.
+UNWRAPPED_TAGS = frozenset({"u"})
+ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
+UNSAFE_TEXT = re.compile(r"[&<>]")
+NON_WHITESPACE = re.compile(r"\S+")
+NUMERIC_REFERENCE = {10: re.compile(r"^([0-9]+)(.*)"), 16: re.compile(r"^([0-9a-f]+)(.*)")}
+ENTITIES = {}
+for _name, _character in sorted(html5.items()):
+    ENTITIES.setdefault(_name.rstrip(";"), _character)
+
+# (numero, text, url) of one <sup> citation, url not yet resolved.
+Citation = Tuple[str, str, str]
+
+
+def escape_text(value: str) -> str:
+    if not UNSAFE_TEXT.search(value):
+        return value
+    return value.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def quote_attribute(value: str) -> str:
+    value = escape_text(value)
+    if '"' not in value:
+        return f'"{value}"'
+    if "'" not in value:
+        return f"'{value}'"
+    return '"' + value.replace('"', "&quot;") + '"'
+
+
+def numeric_reference(name: str) -> str:
+    """Decode the body of ``&#...;`` the way the HTML spec (and BeautifulSoup) does."""
+    base = 10
+    if name[:1] in ("x", "X"):
+        name = name[1:]
+        base = 16
+    extra = ""
+    try:
+        number = int(name, base)
+    except ValueError:
+        match = NUMERIC_REFERENCE[base].search(name)
+        if match is None:
+            return name
+        number = int(match.group(1), base)
+        extra = match.group(2)
+    if number == 0 or number > 0x10FFFF or 0xD800 <= number <= 0xDFFF:
+        return "\ufffd" + extra
+    if 0x80 <= number <= 0x9F:
+        try:
+            return bytes([number]).decode("cp1252") + extra
+        except UnicodeDecodeError:
+            pass
+    return chr(number) + extra
+
+
+class ContentRewriter(HTMLParser):
+    """Rewrite an archived body in one forward pass, without building a tree.
+
+    Images get their real ``src``, links are resolved through ``resolve`` and
+    open in a new tab, ``<u>`` wrappers are dropped, and ``<sup>`` citations
+    are collected for the reference list.
+    """
+
+    def __init__(self, resolve: Callable[[str], str]) -> None:
+        super().__init__(convert_charrefs=False)
+        self.resolve = resolve
+        self.citations: List[Citation] = []
+        self._out: List[str] = []
+        self._text: List[str] = []
+        self._stack: List[str] = []
+        self._open = Counter()
+        self._preserving = 0
+        # Void elements are closed on sight, so a stray end tag for one is skipped.
+        self._closed_voids: List[str] = []
+
+    def _flush(self, prefix: str = "", suffix: str = "") -> None:
+        if not self._text:
+            return
+        data = "".join(self._text)
+        self._text = []
+        if not self._preserving and not data.strip(ASCII_SPACES):
+            data = "\n" if "\n" in data else " "
+        if prefix or suffix:
+            self._out.append(prefix + data + suffix)
+        elif self._stack and self._stack[-1] in RAW_TEXT_TAGS:
+            self._out.append(data)
+        else:
+            self._out.append(escape_text(data))
+
+    def _attributes(self, tag: str, attrs) -> dict:
+        values = {}
+        multi_valued = MULTI_VALUED_BY_TAG.get(tag, MULTI_VALUED_ATTRIBUTES["*"])
+        for key, value in attrs:
+            value = value or ""
+            if key in multi_valued:
+                value = " ".join(NON_WHITESPACE.findall(value))
+            values[key] = value
+        if tag == "img":
+            if values.get("data-actualsrc"):
+                values["src"] = values.pop("data-actualsrc")
+        elif tag == "a":
+            if values.get("href"):
+                values["href"] = self.resolve(values["href"])
+            rel = values.get("rel", "").split()
+            rel += [value for value in ("noopener", "noreferrer") if value not in rel]
+            values["rel"] = " ".join(rel)
+            values["target"] = "_blank"
+        elif tag == "sup":
+            citation = (values.get("data-numero"), values.get("data-text"), values.get("data-url"))
+            if all(citation):
+                self.citations.append(citation)
+        return values
+
+    def _start(self, tag: str, attrs, closes_itself: bool) -> None:
+        self._flush()
+        rendered = ""
+        if attrs or tag == "a":
+            values = self._attributes(tag, attrs)
+            rendered = "".join(f" {key}={quote_attribute(values[key])}" for key in sorted(values))
+        if tag in VOID_ELEMENTS:
+            self._out.append(f"<{tag}{rendered}/>")
+            if closes_itself:
+                self._closed_voids.append(tag)
+            return
+        if tag not in UNWRAPPED_TAGS:
+            self._out.append(f"<{tag}{rendered}>")
+        self._stack.append(tag)
+        self._open[tag] += 1
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self._preserving += 1
+
+    def _pop(self) -> str:
+        tag = self._stack.pop()
+        self._open[tag] -= 1
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self._preserving -= 1
+        if tag not in UNWRAPPED_TAGS:
+            self._out.append(f"</{tag}>")
+        return tag
+
+    def _end(self, tag: str) -> None:
+        self._flush()
+        # An end tag closes everything opened after its start tag; unmatched ones are dropped.
+        if self._open[tag]:
+            while self._pop() != tag:
+                pass
+
+    def handle_starttag(self, tag: str, attrs) -> None:
+        self._start(tag, attrs, closes_itself=True)
+
+    def handle_startendtag(self, tag: str, attrs) -> None:
+        self._start(tag, attrs, closes_itself=False)
+        if tag not in VOID_ELEMENTS:
+            self._end(tag)
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag in self._closed_voids:
+            self._closed_voids.remove(tag)
+        else:
+            self._end(tag)
+
+    def handle_data(self, data: str) -> None:
+        self._text.append(data)
+
+    def handle_charref(self, name: str) -> None:
+        self._text.append(numeric_reference(name))
+
+    def handle_entityref(self, name: str) -> None:
+        self._text.append(ENTITIES.get(name, f"&{name}"))
+
+    def _special(self, data: str, prefix: str, suffix: str) -> None:
+        self._flush()
+        self._text.append(data)
+        self._flush(prefix, suffix)
+
+    def handle_comment(self, data: str) -> None:
+        self._special(data, "<!--", "-->")
+
+    def handle_decl(self, decl: str) -> None:
+        self._special(decl[len("DOCTYPE ") :], "<!DOCTYPE ", ">\n")
+
+    def unknown_decl(self, data: str) -> None:
+        if data.upper().startswith("CDATA["):
+            self._special(data[len("CDATA[") :], "<![CDATA[", "]]>")
+        else:
+            self._special(data, "<?", "?>")
+
+    def handle_pi(self, data: str) -> None:
+        self._special(data, "<?", ">")
+
+    def close(self) -> None:
+        super().close()
+        self._flush()
+        while self._stack:
+            self._pop()
+
+    def getvalue(self) -> str:
+        return "".join(self._out)
+
+
+def rewrite_content(content: str, resolve: Callable[[str], str]) -> Tuple[str, List[Citation]]:
+    """Rewritten HTML of ``content`` plus its citations, in document order."""
+    rewriter = ContentRewriter(resolve)
+    rewriter.feed(content)
+    rewriter.close()
+    return rewriter.getvalue(), rewriter.citations
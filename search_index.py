@@ -0,0 +1,417 @@
+import hashlib
+import json
+import math
+import re
+import shutil
+import unicodedata
+from array import array
+from collections import defaultdict
+from itertools import count
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+
+from segment import Segmenter
+
+SHARD_COUNT = 512
+DOC_CHUNK_SIZE = 64
+INDEX_VERSION = 3
+PASSAGE_BLOCK_SIZE = 32
+PASSAGE_MIN_LENGTH = 40
+PASSAGE_MAX_LENGTH = 200
+# BM25 parameters, shipped in meta.json; title matches count TITLE_WEIGHT times.
+BM25_K1 = 1.2
+BM25_B = 0.75
+TITLE_WEIGHT = 5
+WORD_CACHE_DIR = Path(".cache") / "search" / "words"
+
+# Keep in sync with TERM_PATTERN and hasCJK in summary.search_script.
+CJK_BLOCKS = ((0x3040, 0x30FF), (0x3400, 0x9FFF), (0xF900, 0xFAFF))
+LATIN_BLOCKS = ((0x30, 0x39), (0x61, 0x7A), (0xE0, 0xFF))
+CJK_RANGES = "".join(f"{chr(low)}-{chr(high)}" for low, high in CJK_BLOCKS)
+LATIN_RANGES = "".join(f"{chr(low)}-{chr(high)}" for low, high in LATIN_BLOCKS)
+CJK_PATTERN = re.compile(f"[{CJK_RANGES}]")
+TERM_PATTERN = re.compile(f"[{CJK_RANGES}]+|[{LATIN_RANGES}]+")
+LATIN_WORD = re.compile(f"[{LATIN_RANGES}]+")
+# CJK bigrams are keyed by their two code points, latin words by an id above those.
+WORD_KEY_BASE = 1 << 32
+# Passage breaks fall after punctuation or whitespace, never inside a term.
+SENTENCE_END = re.compile(r"[。！？!?；]+\s*|[.;:]\s+")
+CLAUSE_END = re.compile(r"[，、,]\s*|\s+")
+# NFKC rewrites full-width punctuation, so almost every Chinese passage fails
+# unicodedata's quick check and is normalized the slow way. Swapping the common
+# marks for their decomposition first gives the same result and keeps the fast path.
+FULLWIDTH_PUNCTUATION = [(mark, unicodedata.normalize("NFKD", mark)) for mark in "，：（）？；！…"]
+
+
+def normalize(text: str) -> str:
+    for mark, replacement in FULLWIDTH_PUNCTUATION:
+        text = text.replace(mark, replacement)
+    return unicodedata.normalize("NFKC", text).lower()
+
+
+def in_blocks(points: np.ndarray, blocks: tuple[tuple[int, int], ...]) -> np.ndarray:
+    """Which of the code points fall in any of the inclusive ``(low, high)`` blocks."""
+    mask = np.zeros(len(points), dtype=bool)
+    for low, high in blocks:
+        mask |= (points >= low) & (points <= high)
+    return mask
+
+
+def term_keys(text: str, word_ids: defaultdict[str, int]) -> tuple[np.ndarray, np.ndarray]:
+    """Offsets and keys of the index terms of normalized text, in text order.
+
+    A CJK bigram is keyed by its two code points, ``first << 16 | second``;
+    both are below 0x10000 (see CJK_BLOCKS). A latin word is keyed by
+    ``WORD_KEY_BASE + word_ids[word]``, so the two kinds never collide.
+    """
+    points = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    # A bigram starts at every CJK character followed by another.
+    cjk = in_blocks(points, CJK_BLOCKS)
+    bigram_starts = np.flatnonzero(cjk[:-1] & cjk[1:])
+    bigram_keys = (points[bigram_starts].astype(np.uint64) << 16) | points[bigram_starts + 1]
+    # A word starts at every latin character not preceded by another.
+    latin = in_blocks(points, LATIN_BLOCKS)
+    latin[1:] &= ~latin[:-1]
+    word_starts = np.flatnonzero(latin)
+    word_keys = np.fromiter(
+        (WORD_KEY_BASE + word_ids[word] for word in LATIN_WORD.findall(text)),
+        dtype=np.uint64,
+        count=len(word_starts),
+    )
+    offsets = np.concatenate((bigram_starts, word_starts))
+    order = np.argsort(offsets)
+    return offsets[order], np.concatenate((bigram_keys, word_keys))[order]
+
+
+def key_term(key: int, words: list[str]) -> str:
+    """The term a key from ``term_keys`` stands for; ``words`` lists the word ids in order."""
+    if key >= WORD_KEY_BASE:
+        return words[key - WORD_KEY_BASE]
+    return chr(key >> 16) + chr(key & 0xFFFF)
+
+
+def cut_after(text: str, pattern: re.Pattern) -> list[str]:
+    pieces = []
+    start = 0
+    for match in pattern.finditer(text):
+        if match.end() > start:
+            pieces.append(text[start : match.end()])
+            start = match.end()
+    if start < len(text):
+        pieces.append(text[start:])
+    return pieces
+
+
+def split_passages(text: str) -> list[str]:
+    """Group sentences into passages of PASSAGE_MIN_LENGTH characters or more.
+
+    Sentences longer than PASSAGE_MAX_LENGTH are cut at commas and spaces too;
+    a passage never grows past the maximum by more than one piece.
+    """
+    pieces = []
+    for sentence in cut_after(text, SENTENCE_END):
+        if len(sentence) > PASSAGE_MAX_LENGTH:
+            pieces.extend(cut_after(sentence, CLAUSE_END))
+        else:
+            pieces.append(sentence)
+
+    passages = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(piece) > PASSAGE_MAX_LENGTH:
+            passages.append(current)
+            current = ""
+        current += piece
+        if len(current) >= PASSAGE_MIN_LENGTH:
+            passages.append(current)
+            current = ""
+    if current.strip():
+        passages.append(current)
+    return [passage.strip() for passage in passages]
+
+
+def document_words(segmenter: Segmenter, text: str) -> set[str]:
+    """Dictionary words (two characters or more) found in the CJK runs of text."""
+    words = set()
+    for match in TERM_PATTERN.finditer(normalize(text)):
+        run = match.group()
+        if CJK_PATTERN.match(run):
+            words.update(word for word in segmenter.segment(run) if len(word) > 1)
+    return words
+
+
+def cached_words(
+    segmenter: Segmenter, text: str, cache_dir: Path = WORD_CACHE_DIR
+) -> tuple[str, list[str]]:
+    """``document_words`` of text, cached under a hash of it and the dictionary version.
+
+    Returns the cache file name along with the words.
+    """
+    digest = hashlib.sha256(f"{segmenter.version}\0{text}".encode("utf-8")).hexdigest()
+    path = cache_dir / f"{digest}.txt"
+    if path.exists():
+        return path.name, path.read_text(encoding="utf-8").split()
+    words = sorted(document_words(segmenter, text))
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text("\n".join(words), encoding="utf-8")
+    tmp_path.replace(path)
+    return path.name, words
+
+
+def prune_word_cache(used: set[str], cache_dir: Path = WORD_CACHE_DIR) -> None:
+    if not cache_dir.exists():
+        return
+    for path in cache_dir.iterdir():
+        if path.name not in used:
+            path.unlink()
+
+
+def shard_of(term: str) -> int:
+    """FNV-1a over UTF-16 code units, matching shardOf in the search script."""
+    encoded = term.encode("utf-16-le")
+    value = 0x811C9DC5
+    for index in range(0, len(encoded), 2):
+        value ^= encoded[index] | (encoded[index + 1] << 8)
+        value = (value * 0x01000193) & 0xFFFFFFFF
+    return value % SHARD_COUNT
+
+
+class InvertedIndex:
+    """Positional postings for every term, grouped in bulk once all are added.
+
+    Terms are the bigrams of CJK runs and whole latin words; lone CJK
+    characters are skipped, as the client asks for at least two. Title terms
+    come first in a document's position space, followed by one unused
+    position and then the body passages in order, so ``position <
+    title_length`` marks a title hit.
+
+    ``add`` appends one row per term occurrence to three parallel columns,
+    ``_keys`` (see ``term_keys``), ``_docs`` and ``_positions``, kept as
+    ``array`` rather than lists of ints to hold the whole corpus compactly.
+    ``encode`` then sorts the rows by term and writes the postings.
+    """
+
+    def __init__(self) -> None:
+        # Unseen words get the next id.
+        self.word_ids: defaultdict[str, int] = defaultdict(count().__next__)
+        self.lengths: list[int] = []
+        self.title_lengths: list[int] = []
+        self._keys = array("Q")
+        self._docs = array("I")
+        self._positions = array("I")
+
+    def add(self, title: str, passages: list[str]) -> list[int]:
+        """Index one document and return the number of terms in each passage."""
+        doc = len(self.lengths)
+        # The title and passages are indexed as one text, joined by spaces so
+        # that no term spans two of them. Part 0 is the title.
+        parts = [normalize(title)] + [normalize(passage) for passage in passages]
+        offsets, keys = term_keys(" ".join(parts), self.word_ids)
+        part_starts = np.cumsum([0] + [len(part) + 1 for part in parts[:-1]])
+        part_of = np.searchsorted(part_starts, offsets, side="right") - 1
+        part_lengths = np.bincount(part_of, minlength=len(parts)).tolist()
+        # Terms are numbered in order, skipping one position after the title.
+        positions = np.arange(len(keys), dtype=np.uint32) + (part_of > 0)
+
+        self._keys.frombytes(keys.tobytes())
+        self._docs.frombytes(np.full(len(keys), doc, dtype=np.uint32).tobytes())
+        self._positions.frombytes(positions.astype(np.uint32).tobytes())
+        self.lengths.append(len(keys) + 1)
+        self.title_lengths.append(part_lengths[0])
+        return part_lengths[1:]
+
+    def encode(self) -> "EncodedPostings":
+        """Delta-encode every term's postings as ``[doc, count, pos_1, ..., pos_count, doc, ...]``.
+
+        Doc numbers are relative to the term's previous doc and positions to
+        the previous position in the same doc, which keeps the shard JSON small.
+        Terms are listed in order of first appearance. Consumes the added rows,
+        so call it once, after the last ``add``.
+
+        For example, rows ``(k, 0, 3), (k, 0, 7), (k, 2, 1)`` of one term
+        encode as ``[0, 2, 3, 4, 2, 1, 1]``.
+        """
+        size = len(self._keys)
+        # Sort the rows by term. The sort is stable, so each term's rows stay
+        # in doc and position order. Every column is as long as the corpus,
+        # so each one is released as soon as it is sorted.
+        order = np.argsort(np.frombuffer(self._keys, dtype=np.uint64), kind="stable")
+        keys = np.frombuffer(self._keys, dtype=np.uint64)[order]
+        self._keys = array("Q")
+        term_start = np.ones(size, dtype=bool)
+        np.not_equal(keys[1:], keys[:-1], out=term_start[1:])
+        term_rows = np.flatnonzero(term_start)
+        keys = keys[term_rows]
+        # The first sorted row of a term is the row where it first appeared.
+        appearance = np.argsort(order[term_rows])
+        del term_rows
+        docs = np.frombuffer(self._docs, dtype=np.uint32)[order]
+        self._docs = array("I")
+        positions = np.frombuffer(self._positions, dtype=np.uint32)[order]
+        self._positions = array("I")
+        del order
+
+        # A group is one term's rows within one doc; it encodes as
+        # ``doc, count, positions...``. ``starts`` are the rows opening a group.
+        group_start = np.ones(size, dtype=bool)
+        np.not_equal(docs[1:], docs[:-1], out=group_start[1:])
+        group_start |= term_start
+        starts = np.flatnonzero(group_start)
+        del group_start
+        groups = len(starts)
+        # Groups opening a term; their doc and position stay absolute.
+        first_groups = term_start[starts]
+        del term_start
+
+        first_positions = positions[starts]
+        positions[1:] -= positions[:-1]
+        positions[starts] = first_positions
+        group_docs = docs[starts]
+        del docs, first_positions
+        first_docs = group_docs[first_groups]
+        group_docs[1:] -= group_docs[:-1]
+        group_docs[first_groups] = first_docs
+
+        # Group i's rows move up by the 2 * i header slots before them, and
+        # its header takes the two slots right before its positions.
+        encoded = np.empty(size + 2 * groups, dtype=np.uint32)
+        counts = np.diff(starts, append=size)
+        # In place: ``starts`` is not needed past this point.
+        headers = starts
+        headers += np.arange(0, 2 * groups, 2)
+        encoded[headers] = group_docs
+        encoded[headers + 1] = counts
+        del counts, group_docs
+        is_position = np.ones(len(encoded), dtype=bool)
+        is_position[headers] = False
+        is_position[headers + 1] = False
+        encoded[is_position] = positions
+        del is_position, positions
+
+        # A term's postings run from its first group's header to the next term's.
+        term_groups = np.flatnonzero(first_groups)
+        term_starts = headers[term_groups]
+        term_ends = np.append(term_starts[1:], len(encoded))
+        doc_counts = np.diff(term_groups, append=groups)
+        words = list(self.word_ids)
+        return EncodedPostings(
+            encoded,
+            [key_term(key, words) for key in keys[appearance].tolist()],
+            term_starts[appearance].tolist(),
+            term_ends[appearance].tolist(),
+            doc_counts[appearance].tolist(),
+        )
+
+
+class EncodedPostings:
+    """Encoded postings of all terms, in the order of ``terms``."""
+
+    def __init__(
+        self,
+        encoded: np.ndarray,
+        terms: list[str],
+        starts: list[int],
+        ends: list[int],
+        doc_counts: list[int],
+    ) -> None:
+        self.encoded = encoded
+        self.terms = terms
+        self.starts = starts
+        self.ends = ends
+        self.doc_counts = doc_counts
+
+    def postings(self, index: int) -> list[int]:
+        return self.encoded[self.starts[index] : self.ends[index]].tolist()
+
+
+def bm25_idf(doc_count: int, total: int) -> float:
+    return round(math.log(1 + (total - doc_count + 0.5) / (doc_count + 0.5)), 3)
+
+
+def write_json(path: Path, payload) -> None:
+    # json.dump streams through the pure-Python encoder; dumps uses the C one.
+    text = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def write_search_index(docs: Iterable[dict], output_dir: Path, segmenter: Segmenter) -> dict:
+    """Write meta.json, vocab.json, term shards, doc chunks and passage blocks.
+
+    ``docs`` are the dicts yielded by summary.iter_search_docs, consumed in a
+    single pass: each document's passages and doc chunk entry are written out
+    before the next one is read, and only postings stay in memory. Full text is
+    only published as passages, PASSAGE_BLOCK_SIZE per file.
+    """
+    if output_dir.exists():
+        shutil.rmtree(output_dir)
+    output_dir.mkdir(parents=True)
+
+    index = InvertedIndex()
+    vocabulary: set[str] = set()
+    used_words = set()
+    created = []
+    chunk = []
+    for doc_id, doc in enumerate(docs):
+        passages = split_passages(doc["content"])
+        chunk.append(
+            {
+                "url": doc["url"],
+                "title": doc["title"],
+                "image": doc["image"],
+                "type": doc["type"],
+                "passages": index.add(doc["title"], passages),
+            }
+        )
+        if len(chunk) == DOC_CHUNK_SIZE:
+            write_json(output_dir / f"docs-{doc_id // DOC_CHUNK_SIZE}.json", chunk)
+            chunk = []
+        for block in range(0, len(passages), PASSAGE_BLOCK_SIZE):
+            write_json(
+                output_dir / f"passages-{doc_id}-{block // PASSAGE_BLOCK_SIZE}.json",
+                passages[block : block + PASSAGE_BLOCK_SIZE],
+            )
+        name, words = cached_words(
+            segmenter, f"{doc['title']}\n{doc['excerpt']}\n{doc['content']}"
+        )
+        used_words.add(name)
+        vocabulary.update(words)
+        created.append(doc["created"])
+    if chunk:
+        write_json(output_dir / f"docs-{(len(created) - 1) // DOC_CHUNK_SIZE}.json", chunk)
+    prune_word_cache(used_words)
+    doc_count = len(created)
+
+    # Shard entries are [idf, postings]. Postings become plain lists only one
+    # shard at a time.
+    postings = index.encode()
+    idfs = [bm25_idf(term_docs, doc_count) for term_docs in range(doc_count + 1)]
+    shard_terms: list[list[int]] = [[] for _ in range(SHARD_COUNT)]
+    for term_index, term in enumerate(postings.terms):
+        shard_terms[shard_of(term)].append(term_index)
+    for shard_id, term_indexes in enumerate(shard_terms):
+        shard = {}
+        for term_index in term_indexes:
+            shard[postings.terms[term_index]] = [
+                idfs[postings.doc_counts[term_index]],
+                postings.postings(term_index),
+            ]
+        write_json(output_dir / f"terms-{shard_id}.json", shard)
+
+    meta = {
+        "version": INDEX_VERSION,
+        "shards": SHARD_COUNT,
+        "chunkSize": DOC_CHUNK_SIZE,
+        "passageBlockSize": PASSAGE_BLOCK_SIZE,
+        "created": created,
+        "lengths": index.lengths,
+        "averageLength": round(sum(index.lengths) / max(len(index.lengths), 1), 2),
+        "ranking": {"k1": BM25_K1, "b": BM25_B, "titleWeight": TITLE_WEIGHT},
+        "titleLengths": index.title_lengths,
+    }
+    write_json(output_dir / "meta.json", meta)
+    write_json(output_dir / "vocab.json", " ".join(sorted(vocabulary)))
+    return {"docs": doc_count, "terms": len(postings.terms), "words": len(vocabulary)}
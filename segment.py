@@ -0,0 +1,68 @@
+import hashlib
+import json
+import re
+from pathlib import Path
+
+DICTIONARY_SOURCE = Path("assets") / "segmentit.js"
+# Dictionary literals in the segmentit bundle hold "word|0xPOS|freq" lines.
+STRING_LITERAL = re.compile(r'"((?:[^"\\\n]|\\.)*)"')
+DICTIONARY_LINE = re.compile(r"^\ufeff?([^|\n]+)\|0x[0-9a-fA-F]+\|\d+$", re.M)
+
+
+def load_dictionary(source: Path = DICTIONARY_SOURCE) -> set[str]:
+    """Extract the PanGu dictionary words embedded in the segmentit bundle."""
+    words = set()
+    bundle = source.read_text(encoding="utf-8")
+    for match in STRING_LITERAL.finditer(bundle):
+        if "|0x" not in match.group(1)[:200]:
+            continue
+        literal = json.loads(f'"{match.group(1)}"')
+        words.update(word.strip().lower() for word in DICTIONARY_LINE.findall(literal))
+    words.discard("")
+    return words
+
+
+class Segmenter:
+    """Dictionary segmenter choosing the split with the fewest words.
+
+    Ties go to the longest trailing word. ``segmentRun`` in the search script
+    implements the same rule over the shipped vocabulary.
+    """
+
+    def __init__(self, words: set[str]) -> None:
+        self.words = {word for word in words if len(word) > 1}
+        self.prefixes = {word[:end] for word in self.words for end in range(1, len(word))}
+        digest = hashlib.sha256()
+        for word in sorted(self.words):
+            digest.update(word.encode("utf-8") + b"\n")
+        self.version = digest.hexdigest()
+
+    @classmethod
+    def from_bundle(cls, source: Path = DICTIONARY_SOURCE) -> "Segmenter":
+        return cls(load_dictionary(source))
+
+    def segment(self, run: str) -> list[str]:
+        size = len(run)
+        cost = [0] + [size + 1] * size
+        back = [0] * (size + 1)
+        for start in range(size):
+            step = cost[start] + 1
+            if step < cost[start + 1]:
+                cost[start + 1] = step
+                back[start + 1] = start
+            end = start + 2
+            while end <= size:
+                piece = run[start:end]
+                if piece in self.words and step < cost[end]:
+                    cost[end] = step
+                    back[end] = start
+                if piece not in self.prefixes:
+                    break
+                end += 1
+
+        pieces = []
+        end = size
+        while end > 0:
+            pieces.append(run[back[end] : end])
+            end = back[end]
+        return pieces[::-1]
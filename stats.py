@@ -1,24 +1,22 @@
 import argparse
-import json
-import re
 from collections import defaultdict
 from dataclasses import dataclass, field
 from datetime import datetime
-from html import unescape
-from html.parser import HTMLParser
 from pathlib import Path
 from typing import Dict, Iterable, List, Optional
 
 import matplotlib.pyplot as plt
 from matplotlib import font_manager, rcParams
 
+from catalog import Catalog
+from corpus import open_corpus, source_path
+
 
 @dataclass(frozen=True)
 class SourceConfig:
     key: str
     label: str
     directory: Path
-    timestamp_keys: tuple[str, ...]
     unit_label: str
 
 
@@ -27,14 +25,12 @@ SOURCES: Dict[str, SourceConfig] = {
         key="article",
         label="文章",
         directory=Path("article"),
-        timestamp_keys=("created", "updated"),
         unit_label="篇",
     ),
     "answer": SourceConfig(
         key="answer",
         label="回答",
         directory=Path("answer"),
-        timestamp_keys=("created_time", "created", "updated_time", "updated"),
         unit_label="条",
     ),
 }
@@ -52,68 +48,6 @@ CHINESE_FONT_CANDIDATES = [
 ]
 
 
-class PlainTextExtractor(HTMLParser):
-    """HTML parser that converts markup into normalized plain text."""
-
-    BLOCK_TAGS = {
-        "p",
-        "div",
-        "br",
-        "li",
-        "blockquote",
-        "section",
-        "article",
-        "h1",
-        "h2",
-        "h3",
-        "h4",
-        "h5",
-        "h6",
-    }
-
-    def __init__(self) -> None:
-        super().__init__()
-        self._chunks: List[str] = []
-
-    def handle_starttag(self, tag: str, attrs) -> None:
-        if tag in self.BLOCK_TAGS:
-            self._chunks.append("\n")
-
-    def handle_endtag(self, tag: str) -> None:
-        if tag in self.BLOCK_TAGS:
-            self._chunks.append("\n")
-
-    def handle_data(self, data: str) -> None:
-        if data:
-            self._chunks.append(data)
-
-    def handle_entityref(self, name: str) -> None:
-        self._chunks.append(unescape(f"&{name};"))
-
-    def handle_charref(self, name: str) -> None:
-        self._chunks.append(unescape(f"&#{name};"))
-
-    def get_text(self) -> str:
-        return "".join(self._chunks)
-
-
-def html_to_plain_text(html_content: str) -> str:
-    parser = PlainTextExtractor()
-    parser.feed(html_content)
-    parser.close()
-    text = parser.get_text()
-    return re.sub(r"\s+", " ", text).strip()
-
-
-def count_characters(text: str) -> int:
-    normalized = re.sub(r"\s+", "", text)
-    return len(normalized)
-
-
-def iter_content_files(directory: Path) -> Iterable[Path]:
-    return sorted(p for p in directory.glob("*.json") if p.is_file())
-
-
 def extract_year(data: dict, timestamp_keys: Iterable[str]) -> Optional[int]:
     for key in timestamp_keys:
         raw_value = data.get(key)
@@ -157,31 +91,27 @@ class StatsResult:
     count_totals: Dict[int, int] = field(default_factory=lambda: defaultdict(int))
 
 
-def analyze_source(config: SourceConfig) -> StatsResult:
+def analyze_source(config: SourceConfig, catalog: Catalog, available: bool) -> StatsResult:
+    """Tally plain-text characters and documents per year from the metadata catalog."""
     result = StatsResult()
-    if not config.directory.exists():
+    if not available:
         print(f"目录 {config.directory} 不存在，跳过 {config.label}。")
         return result
 
-    for file_path in iter_content_files(config.directory):
-        try:
-            with open(file_path, "r", encoding="utf-8") as file:
-                data = json.load(file)
-        except (OSError, json.JSONDecodeError) as exc:
-            print(f"跳过 {file_path}: {exc}")
+    for row in catalog.documents(config.key):
+        file_path = source_path(config.key, row["stem"])
+        if row["error"]:
+            print(f"跳过 {file_path}: {row['error']}")
             continue
-
-        content = data.get("content")
-        if not content:
+        if row["chars"] is None:
             continue
 
-        year = extract_year(data, config.timestamp_keys)
+        year = extract_year(row, ("created", "updated"))
         if year is None:
             print(f"跳过 {file_path}: 无法确定年份")
             continue
 
-        plain_text = html_to_plain_text(content)
-        result.char_totals[year] += count_characters(plain_text)
+        result.char_totals[year] += row["chars"]
         result.count_totals[year] += 1
 
     return result
@@ -325,7 +255,17 @@ def main() -> None:
     args = parser.parse_args()
 
     ordered_keys = [key for key in args.types if key in SOURCES]
-    results = {key: analyze_source(SOURCES[key]) for key in ordered_keys}
+    corpus = open_corpus()
+    catalog = Catalog()
+    try:
+        catalog.refresh(corpus, ordered_keys)
+        results = {
+            key: analyze_source(SOURCES[key], catalog, corpus.available(key))
+            for key in ordered_keys
+        }
+    finally:
+        catalog.close()
+        corpus.close()
 
     print_totals(results, ordered_keys)
     if args.plot:
@@ -1,84 +1,54 @@
 import json
-import re
-import shutil
 from pathlib import Path
 from datetime import datetime, timezone
+from typing import Iterator
 
-from bs4 import BeautifulSoup
+from catalog import Catalog
+from corpus import Corpus, open_corpus
+from plaintext import plain_text
+from search_index import write_search_index
+from segment import Segmenter
 
 BASE_URL = "https://l-m-sherlock.github.io/ZhiHuArchive"
-
-# Load censorship data
-with open("censorship.json", "r", encoding="utf-8") as f:
-    censorship_data = json.load(f)
-
-# Collect all articles
-articles = []
-for file in Path("article").glob("*.json"):
-    with open(file, "r", encoding="utf-8") as f:
-        data = json.load(f)
-        data["file_stem"] = file.stem
-        articles.append(data)
-
-# Collect all answers
-answers = []
-for file in Path("answer").glob("*.json"):
-    with open(file, "r", encoding="utf-8") as f:
-        try:
-            data = json.load(f)
-            data["file_stem"] = file.stem
-            if "error" in data:
-                print(data["error"], file.stem)
-                continue
-            answers.append(data)
-        except json.JSONDecodeError:
-            print(file.stem, "is not a valid json file")
-
-# Sort by voteup_count
-articles.sort(key=lambda x: x["voteup_count"], reverse=True)
-answers.sort(key=lambda x: x["voteup_count"], reverse=True)
-
-
-def html_to_text(value: str) -> str:
-    if not value:
-        return ""
-    text = BeautifulSoup(value, "html.parser").get_text(" ", strip=True)
-    return re.sub(r"\s+", " ", text)
-
-
-def build_search_index(articles: list, answers: list) -> list:
-    docs = []
-    for article in articles:
-        docs.append(
-            {
-                "id": f"article-{article['file_stem']}",
-                "url": f"./{article['file_stem']}.html",
-                "title": article.get("title", ""),
-                "excerpt": html_to_text(article.get("excerpt", "")),
-                "content": html_to_text(article.get("content", "")),
-                "image": article.get("image_url", ""),
-                "created": article.get("created", 0),
-                "type": "article",
-            }
-        )
-    for answer in answers:
+HTML_DIR = Path("html")
+
+
+def listed_documents(catalog: Catalog, kind: str) -> list:
+    """Catalog rows of one kind, most upvoted first, skipping error payloads."""
+    documents = []
+    for row in catalog.documents(kind):
+        if row["error"]:
+            print(row["error"], row["stem"])
+            continue
+        documents.append(row)
+    return documents
+
+
+def iter_search_docs(corpus: Corpus, articles: list, answers: list) -> Iterator[dict]:
+    """Yield the text fields the search index needs, loading one body at a time."""
+    for stem, article in corpus.iter_load("article", [row["stem"] for row in articles]):
+        yield {
+            "url": f"./{stem}.html",
+            "title": article.get("title", ""),
+            "excerpt": plain_text(article.get("excerpt", ""), f"article/{stem}/excerpt"),
+            "content": plain_text(article.get("content", ""), f"article/{stem}/content"),
+            "image": article.get("image_url", ""),
+            "created": article.get("created", 0),
+            "type": "article",
+        }
+    for stem, answer in corpus.iter_load("answer", [row["stem"] for row in answers]):
         question = answer.get("question", {})
-        question_title = question.get("title", "Untitled")
-        question_detail = html_to_text(question.get("detail", ""))
-        content_text = html_to_text(answer.get("content", ""))
-        docs.append(
-            {
-                "id": f"answer-{answer['file_stem']}",
-                "url": f"./{answer['file_stem']}.html",
-                "title": question_title,
-                "excerpt": html_to_text(answer.get("excerpt", "")),
-                "content": f"{question_detail} {content_text}".strip(),
-                "image": "",
-                "created": answer.get("created_time", 0),
-                "type": "answer",
-            }
-        )
-    return docs
+        question_detail = plain_text(question.get("detail", ""), f"answer/{stem}/detail")
+        content_text = plain_text(answer.get("content", ""), f"answer/{stem}/content")
+        yield {
+            "url": f"./{stem}.html",
+            "title": question.get("title", "Untitled"),
+            "excerpt": plain_text(answer.get("excerpt", ""), f"answer/{stem}/excerpt"),
+            "content": f"{question_detail} {content_text}".strip(),
+            "image": "",
+            "created": answer.get("created_time", 0),
+            "type": "answer",
+        }
 
 
 search_script = """<script type="module">
@@ -99,103 +69,195 @@ search_script = """<script type="module">
     };
 
     const basePath = getBasePath();
-    const indexUrl = basePath + "search-index.json";
-    const segmentitScript = basePath + "segmentit.js";
-
-    let segmenter = null;
-    let segmenterPromise = null;
-    let indexData = null;
-    let indexPromise = null;
+    const indexBase = basePath + "search/";
+    // Keep in sync with search_index.TERM_PATTERN.
+    const termPattern = /[\\u3040-\\u30ff\\u3400-\\u9fff\\uf900-\\ufaff]+|[0-9a-z\\u00e0-\\u00ff]+/g;
+    const scriptRunPattern = /[\\u3040-\\u30ff\\u3400-\\u9fff\\uf900-\\ufaff]+|[^\\u3040-\\u30ff\\u3400-\\u9fff\\uf900-\\ufaff]+/g;
+
+    let meta = null;
+    let vocabulary = null;
+    let metaPromise = null;
+    const shardCache = new Map();
+    const chunkCache = new Map();
+    const passageCache = new Map();
+    const postingsCache = new Map();
     let lastResults = [];
     let lastRendered = 0;
     let lastSearchToken = 0;
     const pageSize = 10;
     const maxResults = 200;
-    const minCjkLength = 2;
 
-    const shouldSegment = (term) =>
-        hasCJK(term) && !/\\s/.test(term) && term.trim().length >= minCjkLength;
+    const fetchJson = (path) =>
+        fetch(indexBase + path).then((response) => {
+            if (!response.ok) {
+                throw new Error(`${path}: ${response.status}`);
+            }
+            return response.json();
+        });
 
-    const initSegmenter = () => {
-        const lib = window.segmentit || window.Segmentit;
-        if (!lib) {
-            return null;
-        }
-        const Segment = lib.Segment || (lib.default && lib.default.Segment);
-        const useDefault = lib.useDefault || (lib.default && lib.default.useDefault);
-        if (!Segment || !useDefault) {
-            return null;
-        }
-        return useDefault(new Segment());
+    const cachedFetch = (cache, key, path) => {
+        if (!cache.has(key)) {
+            cache.set(
+                key,
+                fetchJson(path).catch((error) => {
+                    cache.delete(key);
+                    throw error;
+                })
+            );
+        }
+        return cache.get(key);
     };
 
-    const loadSegmenter = () =>
-        new Promise((resolve) => {
-            const existing = initSegmenter();
-            if (existing) {
-                resolve(existing);
-                return;
+    const buildVocabulary = (joined) => {
+        const words = new Set(joined.split(" "));
+        const prefixes = new Set();
+        words.forEach((word) => {
+            for (let end = 1; end < word.length; end++) {
+                prefixes.add(word.slice(0, end));
             }
-            const script = document.createElement("script");
-            script.src = segmentitScript;
-            script.async = true;
-            script.onload = () => resolve(initSegmenter());
-            script.onerror = () => resolve(null);
-            document.head.appendChild(script);
         });
+        return { words, prefixes };
+    };
 
-    const ensureSegmenter = (term) => {
-        if (!shouldSegment(term)) {
-            return null;
+    const ensureMeta = () => {
+        if (!metaPromise) {
+            metaPromise = Promise.all([fetchJson("meta.json"), fetchJson("vocab.json")])
+                .then(([data, words]) => {
+                    vocabulary = buildVocabulary(words);
+                    meta = data;
+                    return data;
+                })
+                .catch((error) => {
+                    metaPromise = null;
+                    throw error;
+                });
         }
-        if (segmenter) {
-            return Promise.resolve(segmenter);
+        return metaPromise;
+    };
+
+    // FNV-1a over UTF-16 code units, same as search_index.shard_of.
+    const shardOf = (term) => {
+        let hash = 0x811c9dc5;
+        for (let i = 0; i < term.length; i++) {
+            hash ^= term.charCodeAt(i);
+            hash = Math.imul(hash, 0x01000193) >>> 0;
         }
-        if (!segmenterPromise) {
-            segmenterPromise = loadSegmenter().then((loaded) => {
-                segmenter = loaded;
-                return loaded;
-            });
+        return hash % meta.shards;
+    };
+
+    // Postings are [docDelta, count, posDelta...] runs; decode into doc -> positions.
+    const decodePostings = (encoded) => {
+        const postings = new Map();
+        let doc = 0;
+        let i = 0;
+        while (i < encoded.length) {
+            doc += encoded[i++];
+            const count = encoded[i++];
+            const positions = new Array(count);
+            let position = 0;
+            for (let j = 0; j < count; j++) {
+                position += encoded[i++];
+                positions[j] = position;
+            }
+            postings.set(doc, positions);
         }
-        return segmenterPromise;
+        return postings;
     };
 
-    const segmentText = (text) => {
-        if (!segmenter) {
-            return [];
+    const loadPostings = async (term) => {
+        if (postingsCache.has(term)) {
+            return postingsCache.get(term);
         }
-        try {
-            return segmenter
-                .doSegment(text)
-                .map((token) => token.w || token.word || "")
-                .filter((token) => token && token.trim());
-        } catch (error) {
-            return [];
+        const shardId = shardOf(term);
+        const shard = await cachedFetch(shardCache, shardId, `terms-${shardId}.json`);
+        const [idf, encoded] = Object.prototype.hasOwnProperty.call(shard, term) ? shard[term] : [0, []];
+        const postings = { idf, docs: decodePostings(encoded) };
+        postingsCache.set(term, postings);
+        return postings;
+    };
+
+    const loadDoc = async (doc) => {
+        const chunkId = Math.floor(doc / meta.chunkSize);
+        const chunk = await cachedFetch(chunkCache, chunkId, `docs-${chunkId}.json`);
+        return chunk[doc % meta.chunkSize];
+    };
+
+    // Fewest-words split of a CJK run over the corpus vocabulary, ties to the
+    // longest trailing word; mirrors segment.Segmenter.segment.
+    const segmentRun = (run) => {
+        const size = run.length;
+        const cost = new Array(size + 1).fill(size + 1);
+        const back = new Array(size + 1).fill(0);
+        cost[0] = 0;
+        for (let start = 0; start < size; start++) {
+            const step = cost[start] + 1;
+            if (step < cost[start + 1]) {
+                cost[start + 1] = step;
+                back[start + 1] = start;
+            }
+            for (let end = start + 2; end <= size; end++) {
+                const piece = run.slice(start, end);
+                if (vocabulary.words.has(piece) && step < cost[end]) {
+                    cost[end] = step;
+                    back[end] = start;
+                }
+                if (!vocabulary.prefixes.has(piece)) {
+                    break;
+                }
+            }
+        }
+        const pieces = [];
+        for (let end = size; end > 0; end = back[end]) {
+            pieces.unshift(run.slice(back[end], end));
         }
+        return pieces;
     };
 
-    const ensureIndex = () => {
-        if (indexData) {
-            return Promise.resolve(indexData);
-        }
-        if (!indexPromise) {
-            indexPromise = fetch(indexUrl)
-                .then((response) => response.json())
-                .then((data) => {
-                    indexData = data.map((doc) => {
-                        const title = doc.title || "";
-                        const excerpt = doc.excerpt || "";
-                        const content = doc.content || "";
-                        return {
-                            ...doc,
-                            titleLower: title.toLowerCase(),
-                            searchText: (title + " " + excerpt + " " + content).toLowerCase(),
-                        };
-                    });
-                    return indexData;
-                });
+    // Split a query token into words: CJK runs are segmented and single
+    // characters dropped, unless the run yields no longer word at all.
+    const segmentToken = (token) => {
+        const words = [];
+        for (const match of token.normalize("NFKC").toLowerCase().matchAll(scriptRunPattern)) {
+            const run = match[0].trim();
+            if (!run) {
+                continue;
+            }
+            if (!hasCJK(run)) {
+                words.push(run);
+                continue;
+            }
+            const pieces = segmentRun(run).filter((piece) => piece.length > 1);
+            words.push(...(pieces.length ? pieces : [run]));
+        }
+        return words;
+    };
+
+    // Split text into chains of index terms that must sit at consecutive positions:
+    // the bigrams of one CJK run, or adjacent latin words.
+    const toChains = (text) => {
+        const chains = [];
+        let words = null;
+        for (const match of text.normalize("NFKC").toLowerCase().matchAll(termPattern)) {
+            const run = match[0];
+            if (!hasCJK(run)) {
+                if (words) {
+                    words.push(run);
+                } else {
+                    words = [run];
+                    chains.push(words);
+                }
+                continue;
+            }
+            words = null;
+            const grams = [];
+            for (let i = 0; i + 1 < run.length; i++) {
+                grams.push(run.slice(i, i + 2));
+            }
+            if (grams.length) {
+                chains.push(grams);
+            }
         }
-        return indexPromise;
+        return chains;
     };
 
     const escapeRegExp = (value) => value.replace(/[.*+?^${}()|[\\]\\\\]/g, "\\$&");
@@ -222,56 +284,147 @@ search_script = """<script type="module">
         if (phrases.length) {
             remaining = trimmed.replace(phraseRegex, " ").trim();
         }
-        let tokens = remaining ? remaining.split(/\\s+/).filter(Boolean) : [];
-        if (!tokens.length && shouldSegment(trimmed) && segmenter) {
-            tokens = segmentText(trimmed);
-        }
-        if (!tokens.length && trimmed) {
-            tokens = [trimmed];
-        }
-        const tokensLower = tokens.map((token) => token.toLowerCase());
+        const tokens = remaining ? remaining.split(/\\s+/).filter(Boolean) : [];
+        const words = tokens.map(segmentToken);
+        const tokensLower = [...new Set(words.flat())];
         const phrasesLower = phrases.map((phrase) => phrase.toLowerCase());
         const highlightTerms = [...phrasesLower, ...tokensLower]
             .filter((value) => value.length > 0)
             .slice(0, 8);
-        return { raw: trimmed, lower, tokens: tokensLower, phrases: phrasesLower, highlights: highlightTerms };
+        const clauses = [
+            ...phrasesLower.map((text) => ({ chains: toChains(text) })),
+            ...tokensLower.map((text) => ({ chains: toChains(text) })),
+        ].filter((clause) => clause.chains.length > 0);
+        // Tokens that segmentation split or trimmed also score, optionally, as one exact run.
+        const required = new Set(clauses.flatMap((clause) => clause.chains.map((chain) => chain.join(" "))));
+        const boosts = tokens.flatMap(toChains).filter((chain) => !required.has(chain.join(" ")));
+        return {
+            raw: trimmed,
+            lower,
+            tokens: tokensLower,
+            phrases: phrasesLower,
+            highlights: highlightTerms,
+            clauses,
+            boosts,
+        };
     };
 
-    const matchesDoc = (doc, query) => {
-        const text = doc.searchText || "";
-        if (query.phrases.length && query.phrases.some((phrase) => !text.includes(phrase))) {
-            return false;
+    // Start positions of chain in doc, in ascending order.
+    const chainStarts = (chain, postings, doc) => {
+        const first = postings.get(chain[0]).docs.get(doc);
+        if (!first) {
+            return [];
         }
-        if (query.tokens.length && query.tokens.some((token) => !text.includes(token))) {
-            return false;
+        if (chain.length === 1) {
+            return first;
         }
-        return true;
+        const rest = [];
+        for (let i = 1; i < chain.length; i++) {
+            const positions = postings.get(chain[i]).docs.get(doc);
+            if (!positions) {
+                return [];
+            }
+            rest.push(new Set(positions));
+        }
+        return first.filter((start) => rest.every((positions, i) => positions.has(start + i + 1)));
+    };
+
+    // BM25 over chain matches. A chain's rarest term stands in for its IDF and
+    // title matches count titleWeight times.
+    const chainScore = (chain, starts, postings, doc) => {
+        const { k1, b, titleWeight } = meta.ranking;
+        const titleLength = meta.titleLengths[doc];
+        let titleHits = 0;
+        while (titleHits < starts.length && starts[titleHits] < titleLength) {
+            titleHits++;
+        }
+        const tf = starts.length - titleHits + titleWeight * titleHits;
+        const idf = Math.max(...chain.map((term) => postings.get(term).idf));
+        const norm = k1 * (1 - b + (b * meta.lengths[doc]) / meta.averageLength);
+        return (idf * tf * (k1 + 1)) / (tf + norm);
     };
 
-    const scoreDoc = (doc, query) => {
+    // Returns null unless every clause chain matches; boost chains only add score.
+    const scoreDoc = (doc, query, postings) => {
         let score = 0;
-        const title = doc.titleLower || "";
-        if (query.raw && title.includes(query.lower)) {
-            score += 100;
-        }
-        query.phrases.forEach((phrase) => {
-            if (title.includes(phrase)) {
-                score += 60;
-            } else if (doc.searchText.includes(phrase)) {
-                score += 20;
+        for (const clause of query.clauses) {
+            for (const chain of clause.chains) {
+                const starts = chainStarts(chain, postings, doc);
+                if (!starts.length) {
+                    return null;
+                }
+                score += chainScore(chain, starts, postings, doc);
             }
-        });
-        query.tokens.forEach((token) => {
-            if (!token) {
+        }
+        for (const chain of query.boosts) {
+            const starts = chainStarts(chain, postings, doc);
+            if (starts.length) {
+                score += chainScore(chain, starts, postings, doc);
+            }
+        }
+        return score;
+    };
+
+    const compareMatches = (a, b) => (a.score - b.score) || (meta.created[a.doc] - meta.created[b.doc]);
+
+    // Min-heap holding the best `limit` matches; the root is the weakest kept match.
+    const pushTopK = (heap, item, limit) => {
+        if (heap.length < limit) {
+            heap.push(item);
+            let i = heap.length - 1;
+            while (i > 0) {
+                const parent = (i - 1) >> 1;
+                if (compareMatches(heap[parent], heap[i]) <= 0) {
+                    break;
+                }
+                [heap[parent], heap[i]] = [heap[i], heap[parent]];
+                i = parent;
+            }
+            return;
+        }
+        if (compareMatches(item, heap[0]) <= 0) {
+            return;
+        }
+        heap[0] = item;
+        let i = 0;
+        while (true) {
+            const left = 2 * i + 1;
+            const right = left + 1;
+            let smallest = i;
+            if (left < heap.length && compareMatches(heap[left], heap[smallest]) < 0) {
+                smallest = left;
+            }
+            if (right < heap.length && compareMatches(heap[right], heap[smallest]) < 0) {
+                smallest = right;
+            }
+            if (smallest === i) {
                 return;
             }
-            if (title.includes(token)) {
-                score += 20;
-            } else if (doc.searchText.includes(token)) {
-                score += 4;
+            [heap[smallest], heap[i]] = [heap[i], heap[smallest]];
+            i = smallest;
+        }
+    };
+
+    const runQuery = async (query) => {
+        const required = new Set(query.clauses.flatMap((clause) => clause.chains.flat()));
+        const terms = [...new Set([...required, ...query.boosts.flat()])];
+        const postings = new Map(await Promise.all(terms.map(async (term) => [term, await loadPostings(term)])));
+        query.postings = postings;
+        let candidates = null;
+        required.forEach((term) => {
+            const docs = postings.get(term).docs;
+            if (!candidates || docs.size < candidates.size) {
+                candidates = docs;
             }
         });
-        return score;
+        const heap = [];
+        for (const doc of candidates.keys()) {
+            const score = scoreDoc(doc, query, postings);
+            if (score !== null) {
+                pushTopK(heap, { doc, score }, maxResults);
+            }
+        }
+        return heap.sort((a, b) => compareMatches(b, a));
     };
 
     const highlightText = (text, terms) => {
@@ -307,51 +460,85 @@ search_script = """<script type="module">
         return { start, end: Math.min(sourceLength, start + maxLength) };
     };
 
-    const findBestSnippetMatch = (source, terms, maxLength) => {
-        const lowerSource = source.toLowerCase();
-        let bestMatch = null;
-
-        terms.forEach((term) => {
-            let matchIndex = lowerSource.indexOf(term);
-            while (matchIndex !== -1) {
-                const { start, end } = getSnippetBounds(source.length, matchIndex, term.length, maxLength);
-                const snippetWindow = lowerSource.slice(start, end);
-                const matchedTermCount = terms.filter((candidate) => snippetWindow.includes(candidate)).length;
+    // Index of the first passage ending after position; ends is ascending.
+    const passageAt = (ends, position) => {
+        let low = 0;
+        let high = ends.length - 1;
+        while (low < high) {
+            const mid = (low + high) >> 1;
+            if (ends[mid] > position) {
+                high = mid;
+            } else {
+                low = mid + 1;
+            }
+        }
+        return low;
+    };
 
-                if (!bestMatch || matchedTermCount > bestMatch.matchedTermCount) {
-                    bestMatch = { source, start, end, matchedTermCount };
+    // The body passage covering the most distinct query chains, then the most matches.
+    const bestPassage = (doc, info, query) => {
+        const bodyStart = meta.titleLengths[doc] + 1;
+        const ends = [];
+        let end = bodyStart;
+        info.passages.forEach((length) => {
+            end += length;
+            ends.push(end);
+        });
+        const found = new Map();
+        const chains = [...query.clauses.flatMap((clause) => clause.chains), ...query.boosts];
+        chains.forEach((chain, chainIndex) => {
+            for (const start of chainStarts(chain, query.postings, doc)) {
+                if (start < bodyStart) {
+                    continue;
                 }
-                matchIndex = lowerSource.indexOf(term, matchIndex + term.length);
+                const passage = passageAt(ends, start);
+                const entry = found.get(passage) || { chains: new Set(), hits: 0 };
+                entry.chains.add(chainIndex);
+                entry.hits += 1;
+                found.set(passage, entry);
             }
         });
-
-        return bestMatch;
-    };
-
-    const truncateSnippet = (text, maxLength) =>
-        text.length > maxLength ? text.slice(0, maxLength) + "..." : text;
-
-    const buildSnippet = (doc, query, maxLength = 220) => {
-        const queryTerms = [...query.phrases, ...query.tokens];
-        const nonEmptyTerms = queryTerms.filter((term) => term.length > 0);
-        const terms = [...new Set(nonEmptyTerms)];
-        const sources = [doc.content || "", doc.excerpt || ""].filter((source) => source.length > 0);
-        let bestMatch = null;
-
-        sources.forEach((source) => {
-            const candidate = findBestSnippetMatch(source, terms, maxLength);
-            if (candidate && (!bestMatch || candidate.matchedTermCount > bestMatch.matchedTermCount)) {
-                bestMatch = candidate;
+        let best = 0;
+        let bestEntry = null;
+        found.forEach((entry, passage) => {
+            const better =
+                !bestEntry ||
+                entry.chains.size > bestEntry.chains.size ||
+                (entry.chains.size === bestEntry.chains.size &&
+                    (entry.hits > bestEntry.hits || (entry.hits === bestEntry.hits && passage < best)));
+            if (better) {
+                best = passage;
+                bestEntry = entry;
             }
         });
+        return best;
+    };
 
-        if (!bestMatch) {
-            return truncateSnippet(doc.excerpt || doc.content || "", maxLength);
-        }
+    const loadPassage = async (doc, index) => {
+        const block = Math.floor(index / meta.passageBlockSize);
+        const passages = await cachedFetch(passageCache, `${doc}-${block}`, `passages-${doc}-${block}.json`);
+        return passages[index % meta.passageBlockSize];
+    };
 
-        const prefix = bestMatch.start > 0 ? "..." : "";
-        const suffix = bestMatch.end < bestMatch.source.length ? "..." : "";
-        return prefix + bestMatch.source.slice(bestMatch.start, bestMatch.end) + suffix;
+    const buildSnippet = async (item, info, maxLength = 220) => {
+        if (!info.passages.length) {
+            return "";
+        }
+        const index = bestPassage(item.doc, info, item.query);
+        const text = await loadPassage(item.doc, index);
+        let start = 0;
+        let end = text.length;
+        if (text.length > maxLength) {
+            const lower = text.toLowerCase();
+            const matchIndex = item.highlights
+                .map((term) => lower.indexOf(term))
+                .filter((position) => position >= 0)
+                .reduce((first, position) => Math.min(first, position), text.length);
+            ({ start, end } = getSnippetBounds(text.length, matchIndex % text.length, 0, maxLength));
+        }
+        const prefix = index > 0 || start > 0 ? "..." : "";
+        const suffix = index < info.passages.length - 1 || end < text.length ? "..." : "";
+        return prefix + text.slice(start, end) + suffix;
     };
 
     const clearResults = () => {
@@ -362,10 +549,17 @@ search_script = """<script type="module">
         lastRendered = 0;
     };
 
-    const renderBatch = () => {
+    const renderBatch = async () => {
+        const token = lastSearchToken;
         const slice = lastResults.slice(lastRendered, lastRendered + pageSize);
-        slice.forEach((item) => {
-            const doc = item.doc;
+        lastRendered += slice.length;
+        const docs = await Promise.all(slice.map((item) => loadDoc(item.doc)));
+        const snippets = await Promise.all(slice.map((item, i) => buildSnippet(item, docs[i])));
+        if (token !== lastSearchToken) {
+            return;
+        }
+        slice.forEach((item, i) => {
+            const doc = docs[i];
             const li = document.createElement("li");
             li.className = "search-result";
             const title = doc.title || doc.url || "未命名";
@@ -373,15 +567,13 @@ search_script = """<script type="module">
             const thumb = doc.image
                 ? `<div class="search-result-thumb"><img src="${doc.image}" alt="${escapeHtml(title)}"></div>`
                 : "";
-            const snippet = buildSnippet(doc, item.query);
-            const highlightedSnippet = highlightText(snippet, item.highlights);
+            const highlightedSnippet = highlightText(snippets[i], item.highlights);
             li.innerHTML = `${thumb}<div class="search-result-body">
                 <p class="search-result-title"><a href="${doc.url}" target="_blank" rel="noopener noreferrer">${highlightedTitle}</a></p>
                 <p class="search-result-excerpt">${highlightedSnippet}</p>
             </div>`;
             resultsEl.appendChild(li);
         });
-        lastRendered += slice.length;
         if (lastRendered >= lastResults.length) {
             moreButton.style.display = "none";
         } else {
@@ -397,21 +589,30 @@ search_script = """<script type="module">
             return;
         }
         metaEl.textContent = "正在加载索引…";
-        const docs = await ensureIndex();
-        if (token !== lastSearchToken) {
+        let query;
+        let matches;
+        try {
+            await ensureMeta();
+            if (token !== lastSearchToken) {
+                return;
+            }
+            query = buildQuery(trimmed);
+            if (!query.clauses.length) {
+                clearResults();
+                metaEl.textContent = "中文请至少输入两个字";
+                return;
+            }
+            matches = await runQuery(query);
+        } catch (error) {
+            if (token === lastSearchToken) {
+                metaEl.textContent = "索引加载失败，请稍后重试";
+            }
             return;
         }
-        const segmentPromise = ensureSegmenter(trimmed);
-        const query = buildQuery(trimmed);
-
-        const matches = [];
-        for (const doc of docs) {
-            if (matchesDoc(doc, query)) {
-                matches.push({ doc, score: scoreDoc(doc, query), highlights: query.highlights, query });
-            }
+        if (token !== lastSearchToken) {
+            return;
         }
-        matches.sort((a, b) => (b.score - a.score) || (b.doc.created - a.doc.created));
-        lastResults = matches.slice(0, maxResults);
+        lastResults = matches.map((match) => ({ ...match, highlights: query.highlights, query }));
         lastRendered = 0;
         resultsEl.innerHTML = "";
 
@@ -422,20 +623,6 @@ search_script = """<script type="module">
             metaEl.textContent = `找到 ${lastResults.length} 个与“${trimmed}”相关的结果`;
             renderBatch();
         }
-
-        if (segmentPromise && !segmenter) {
-            segmentPromise.then((loaded) => {
-                if (!loaded) {
-                    return;
-                }
-                if (token !== lastSearchToken) {
-                    return;
-                }
-                if (input.value.trim() === trimmed) {
-                    searchAndRender(trimmed);
-                }
-            });
-        }
     };
 
     const debounce = (fn, delay = 300) => {
@@ -457,9 +644,8 @@ search_script = """<script type="module">
 </script>
 """
 
-# Generate HTML content with tabs
-html_content = (
-    """
+# Static top of the index page; index_page adds the search box and listings.
+INDEX_HEAD = """
 <!DOCTYPE html>
 <html lang="zh-CN">
 <head>
@@ -625,7 +811,11 @@ html_content = (
 </head>
 <body data-pagefind-ignore="all">
 """
-    + f"""
+
+
+def index_page(articles: list, answers: list, censorship: dict) -> str:
+    """The index page listing every article and answer, with the search box."""
+    html_content = INDEX_HEAD + f"""
     <h1>Thoughts Memo 和 Jarrett Ye 的知乎备份</h1>
     <p>
         <a class="badge-link" href="https://github.com/L-M-Sherlock/ZhiHuArchive" target="_blank" rel="noopener noreferrer">
@@ -638,7 +828,7 @@ html_content = (
     <div id="search">
         <label class="search-label" for="search-input">站内搜索</label>
         <input id="search-input" class="search-input" type="search" placeholder="搜索文章和回答..." autocapitalize="none" enterkeyhint="search">
-        <div class="search-helper">提示：首次搜索会加载索引，中文搜索会加载分词库；也支持手动分词（例如：习得性 无助）。</div>
+        <div class="search-helper">提示：首次搜索会加载索引，中文会按词典自动分词；也支持手动分词（例如：习得性 无助）。</div>
         <div id="search-meta" class="search-meta"></div>
         <ol id="search-results" class="search-results"></ol>
         <button id="search-more" class="search-more" type="button" style="display: none;">加载更多结果</button>
@@ -653,68 +843,50 @@ html_content = (
     <div id="articles-tab" class="tab-content active">
         <h2>文章</h2>
 """
-)
-
-# Add articles
-for article in articles:
-    article_path = f"/p/{article['file_stem']}"
-    is_censored = censorship_data.get(article_path, False)
-    censored_class = "censored" if is_censored else ""
-    censored_text = " (censored)" if is_censored else ""
-    html_content += f"""
+
+    # Add articles
+    for article in articles:
+        article_path = f"/p/{article['stem']}"
+        is_censored = censorship.get(article_path, False)
+        censored_class = "censored" if is_censored else ""
+        censored_text = " (censored)" if is_censored else ""
+        html_content += f"""
         <div class="item">
-            <a href="./{article['file_stem']}.html" class="{censored_class}" target="_blank" rel="noopener noreferrer">{article['title']}{censored_text}</a>
+            <a href="./{article['stem']}.html" class="{censored_class}" target="_blank" rel="noopener noreferrer">{article['title']}{censored_text}</a>
             <span class="votes">({article['voteup_count']} 赞同)</span>
             <span class="created_time">({datetime.fromtimestamp(article['created']).strftime('%Y-%m-%d')})</span>
         </div>
 """
 
-html_content += """
+    html_content += """
     </div>
 
     <div id="answers-tab" class="tab-content">
         <h2>回答</h2>
 """
 
-# Add answers
-for answer in answers:
-    question_title = (
-        answer["question"]["title"]
-        if "question" in answer and "title" in answer["question"]
-        else "Untitled"
-    )
-    answer_path = f"/answer/{answer['file_stem']}"
-    is_censored = censorship_data.get(answer_path, False)
-    censored_class = "censored" if is_censored else ""
-    censored_text = " (censored)" if is_censored else ""
+    # Add answers
+    for answer in answers:
+        question_title = answer["title"]
+        answer_path = f"/answer/{answer['stem']}"
+        is_censored = censorship.get(answer_path, False)
+        censored_class = "censored" if is_censored else ""
+        censored_text = " (censored)" if is_censored else ""
 
-    html_content += f"""
+        html_content += f"""
         <div class="item">
-            <a href="./{answer['file_stem']}.html" class="{censored_class}" target="_blank" rel="noopener noreferrer">{question_title}{censored_text}</a>
+            <a href="./{answer['stem']}.html" class="{censored_class}" target="_blank" rel="noopener noreferrer">{question_title}{censored_text}</a>
             <span class="votes">({answer['voteup_count']} 赞同)</span>
-            <span class="created_time">({datetime.fromtimestamp(answer['created_time']).strftime('%Y-%m-%d')})</span>
+            <span class="created_time">({datetime.fromtimestamp(answer['created']).strftime('%Y-%m-%d')})</span>
         </div>
 """
 
-html_content += """
+    html_content += """
     </div>
 </body>
 </html>
 """
-
-# Write the HTML file
-Path("html").mkdir(exist_ok=True)
-asset_src = Path("assets") / "segmentit.js"
-asset_dst = Path("html") / "segmentit.js"
-if asset_src.exists():
-    shutil.copyfile(asset_src, asset_dst)
-
-with open("./html/index.html", "w", encoding="utf-8") as f:
-    f.write(html_content)
-
-search_docs = build_search_index(articles, answers)
-with open("./html/search-index.json", "w", encoding="utf-8") as f:
-    json.dump(search_docs, f, ensure_ascii=False)
+    return html_content
 
 
 def html_lastmod(path: Path, fallback_timestamp=None) -> str:
@@ -743,11 +915,11 @@ def generate_sitemap(articles, answers):
     # Add articles
     for article in articles:
         lastmod = html_lastmod(
-            Path("html") / f"{article['file_stem']}.html",
+            Path("html") / f"{article['stem']}.html",
             article["created"],
         )
         sitemap_content += f"""  <url>
-    <loc>{BASE_URL}/{article['file_stem']}.html</loc>
+    <loc>{BASE_URL}/{article['stem']}.html</loc>
     <lastmod>{lastmod}</lastmod>
     <changefreq>monthly</changefreq>
     <priority>0.8</priority>
@@ -756,11 +928,11 @@ def generate_sitemap(articles, answers):
     # Add answers
     for answer in answers:
         lastmod = html_lastmod(
-            Path("html") / f"{answer['file_stem']}.html",
-            answer["created_time"],
+            Path("html") / f"{answer['stem']}.html",
+            answer["created"],
         )
         sitemap_content += f"""  <url>
-    <loc>{BASE_URL}/{answer['file_stem']}.html</loc>
+    <loc>{BASE_URL}/{answer['stem']}.html</loc>
     <lastmod>{lastmod}</lastmod>
     <changefreq>monthly</changefreq>
     <priority>0.8</priority>
@@ -773,5 +945,35 @@ def generate_sitemap(articles, answers):
         f.write(sitemap_content)
 
 
-# Add after writing index.html
-generate_sitemap(articles, answers)
+def main() -> None:
+    with open("censorship.json", "r", encoding="utf-8") as f:
+        censorship = json.load(f)
+
+    # Collect metadata for all articles and answers; bodies are only read for search.
+    corpus = open_corpus()
+    catalog = Catalog()
+    catalog.refresh(corpus)
+    articles = listed_documents(catalog, "article")
+    answers = listed_documents(catalog, "answer")
+    catalog.close()
+
+    HTML_DIR.mkdir(exist_ok=True)
+    (HTML_DIR / "segmentit.js").unlink(missing_ok=True)
+    with open(HTML_DIR / "index.html", "w", encoding="utf-8") as f:
+        f.write(index_page(articles, answers, censorship))
+
+    search_stats = write_search_index(
+        iter_search_docs(corpus, articles, answers), HTML_DIR / "search", Segmenter.from_bundle()
+    )
+    corpus.close()
+    (HTML_DIR / "search-index.json").unlink(missing_ok=True)
+    print(
+        f"Indexed {search_stats['docs']} documents, {search_stats['terms']} terms, "
+        f"{search_stats['words']} words"
+    )
+
+    generate_sitemap(articles, answers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import argparse
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import download
+from workqueue import DONE, PENDING, WorkQueue
+
+
+class SyncQueueTest(unittest.TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        root = Path(directory.name)
+        (root / "answer").mkdir()
+        (root / "article").mkdir()
+        (root / "answer" / "1.json").write_text("{}", encoding="utf-8")
+        (root / "paths.json").write_text(json.dumps(["/answer/1", "/answer/2"]), encoding="utf-8")
+        (root / "not_found.txt").write_text("", encoding="utf-8")
+        for name, value in {
+            "ANSWER_DIR": root / "answer",
+            "ARTICLE_DIR": root / "article",
+            "PATHS_FILE": root / "paths.json",
+            "NOT_FOUND_FILE": root / "not_found.txt",
+        }.items():
+            patch = mock.patch.object(download, name, value)
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.root = root
+        self.queue = WorkQueue(root / "queue.sqlite3")
+        self.addCleanup(self.queue.close)
+
+    def states(self) -> dict[str, str]:
+        return dict(self.queue.conn.execute("SELECT path, state FROM items"))
+
+    def test_archived_paths_start_done(self) -> None:
+        download.sync_queue(self.queue)
+        self.assertEqual(self.states(), {"/answer/1": DONE, "/answer/2": PENDING})
+
+    def test_requeued_refresh_survives_a_restart(self) -> None:
+        download.sync_queue(self.queue)
+        self.queue.requeue(["/answer/1"])
+        self.queue.claim(1)
+        download.sync_queue(self.queue)
+        self.assertEqual(self.states()["/answer/1"], PENDING)
+
+    def test_replay_leaves_unrecorded_paths_as_they_were(self) -> None:
+        download.sync_queue(self.queue)
+        args = argparse.Namespace(
+            api="http://127.0.0.1:9",
+            cache=self.root / "responses.sqlite3",
+            cache_ttl=0,
+            replay=True,
+            rate=0,
+            workers=2,
+            timeout=1,
+            backoff=60,
+            attempts=5,
+        )
+        self.assertEqual(download.download_content(self.queue, args), 0)
+        row = self.queue.conn.execute(
+            "SELECT state, attempts, next_eligible FROM items WHERE path = ?", ("/answer/2",)
+        ).fetchone()
+        self.assertEqual(row, (PENDING, 0, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
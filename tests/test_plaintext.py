@@ -0,0 +1,44 @@
+import sqlite3
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from plaintext import TEXT_CACHE_VERSION, TextCache
+
+
+def open_and_extract(path: Path) -> str:
+    cache = TextCache(path)
+    try:
+        return cache.text("answer/1/content", "<p>one<b>two</b></p>")
+    finally:
+        cache.close()
+
+
+class TextCacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / "plaintext.sqlite3"
+        conn = sqlite3.connect(self.path)
+        conn.execute("CREATE TABLE texts (hash TEXT PRIMARY KEY, text TEXT NOT NULL)")
+        conn.commit()
+        conn.close()
+
+    def test_migrates_legacy_file_once(self) -> None:
+        self.assertEqual(open_and_extract(self.path), "one two")
+        conn = sqlite3.connect(self.path)
+        tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master")}
+        (version,) = conn.execute("PRAGMA user_version").fetchone()
+        conn.close()
+        self.assertNotIn("texts", tables)
+        self.assertEqual(version, TEXT_CACHE_VERSION)
+
+    def test_concurrent_opens_share_one_migration(self) -> None:
+        with ProcessPoolExecutor(max_workers=4) as executor:
+            texts = list(executor.map(open_and_extract, [self.path] * 8))
+        self.assertEqual(texts, ["one two"] * 8)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import threading
+import unittest
+
+from radar import Check, run_checks
+
+COLLAPSED = "https://api.test/answers/1"
+VISIBLE = "https://api.test/answers/2"
+HIDDEN = "https://api.test/answers/3"
+
+
+class FakeProber:
+    """Answers from a table instead of the API, recording every request."""
+
+    def __init__(self) -> None:
+        self.requests: list[tuple[str, str]] = []
+        self._lock = threading.Lock()
+
+    def cookie(self, cookie_key: str) -> str:
+        return cookie_key
+
+    def fetch(self, url: str, cookie_key: str) -> dict:
+        with self._lock:
+            self.requests.append((url, cookie_key))
+        if url == COLLAPSED:
+            return {"is_collapsed": True}
+        if url == HIDDEN and cookie_key == "VIEWER":
+            return {"error": {"code": 4041}}
+        return {"is_collapsed": False}
+
+
+class RunChecksTest(unittest.TestCase):
+    def test_asks_viewer_only_when_owner_view_is_inconclusive(self) -> None:
+        checks = [
+            Check(url, url, "OWNER", "VIEWER", check_answer_collapse=True)
+            for url in (COLLAPSED, VISIBLE, HIDDEN)
+        ]
+        prober = FakeProber()
+        verdicts = {check.url: verdict for check, verdict in run_checks(checks, prober, 2)}
+        self.assertEqual(verdicts, {COLLAPSED: True, VISIBLE: False, HIDDEN: True})
+        self.assertEqual(
+            sorted(prober.requests),
+            sorted(
+                [
+                    (COLLAPSED, "OWNER"),
+                    (VISIBLE, "OWNER"),
+                    (VISIBLE, "VIEWER"),
+                    (HIDDEN, "OWNER"),
+                    (HIDDEN, "VIEWER"),
+                ]
+            ),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import argparse
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from apicache import CacheMiss, ResponseCache
+from mock_zhihu import serve_mock_api
+from radar import make_prober
+
+
+class ReplayTest(unittest.TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache_path = Path(directory.name) / "responses.sqlite3"
+        environ = mock.patch.dict(os.environ, {"COOKIE_A": "owner-cookie"})
+        environ.start()
+        self.addCleanup(environ.stop)
+
+    def fetch(self, url: str, replay: bool) -> dict:
+        cache = ResponseCache(self.cache_path, replay=replay)
+        args = argparse.Namespace(dry_run=False, replay=replay, rate=0, workers=1)
+        prober = make_prober(args, cache)
+        try:
+            return prober.fetch(url, "COOKIE_A")
+        finally:
+            prober.close()
+            cache.close()
+
+    def test_replays_recorded_response_offline(self) -> None:
+        server, api_base = serve_mock_api()
+        url = f"{api_base}/api/v4/answers/123"
+        try:
+            recorded = self.fetch(url, replay=False)
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(self.fetch(url, replay=True), recorded)
+
+    def test_replay_misses_responses_of_another_cookie(self) -> None:
+        server, api_base = serve_mock_api()
+        url = f"{api_base}/api/v4/answers/123"
+        try:
+            self.fetch(url, replay=False)
+        finally:
+            server.shutdown()
+            server.server_close()
+        with mock.patch.dict(os.environ, {"COOKIE_A": "replaced-cookie"}):
+            with self.assertRaises(CacheMiss):
+                self.fetch(url, replay=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
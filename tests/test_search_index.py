@@ -0,0 +1,24 @@
+import unittest
+
+from search_index import InvertedIndex
+
+
+class InvertedIndexTest(unittest.TestCase):
+    def test_encodes_terms_in_order_of_first_appearance(self) -> None:
+        index = InvertedIndex()
+        self.assertEqual(index.add("检索 abc", ["中文检索", "abc x"]), [3, 2])
+        self.assertEqual(index.add("", ["abc"]), [1])
+        self.assertEqual(index.lengths, [8, 2])
+        self.assertEqual(index.title_lengths, [2, 0])
+
+        postings = index.encode()
+        self.assertEqual(postings.terms, ["检索", "abc", "中文", "文检", "x"])
+        # Title positions 0-1, then one unused position, then the passages.
+        self.assertEqual(postings.postings(0), [0, 2, 0, 5])
+        self.assertEqual(postings.postings(1), [0, 2, 1, 5, 1, 1, 1])
+        self.assertEqual(postings.postings(4), [0, 1, 7])
+        self.assertEqual(postings.doc_counts, [1, 2, 1, 1, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,187 @@
+import sqlite3
+import time
+from pathlib import Path
+from typing import Iterable, Optional
+
+PENDING = "pending"
+IN_FLIGHT = "in_flight"
+DONE = "done"
+NOT_FOUND = "404"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    path TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_eligible REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_state ON items (state, next_eligible);
+"""
+# Columns added after the first release, created on open if missing.
+LATER_COLUMNS = {
+    "etag": "TEXT",
+    "last_modified": "TEXT",
+    "checked": "REAL",
+}
+
+
+class WorkQueue:
+    """Durable per-path download state in SQLite.
+
+    Every state change is committed immediately, so an interrupted run loses
+    at most its in-flight requests, which ``recover`` puts back in the queue.
+    Use the queue from a single thread.
+    """
+
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        existing = {row[1] for row in self.conn.execute("PRAGMA table_info(items)")}
+        with self.conn:
+            for column, declaration in LATER_COLUMNS.items():
+                if column not in existing:
+                    self.conn.execute(f"ALTER TABLE items ADD COLUMN {column} {declaration}")
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def _set_state(
+        self,
+        paths: Iterable[str],
+        state: str,
+        *,
+        only_from: Optional[str] = None,
+        keep: tuple[str, ...] = (),
+    ) -> int:
+        now = time.time()
+        query = "UPDATE items SET state = ?, updated = ? WHERE path = ?"
+        if only_from is not None:
+            query += " AND state = ?"
+            rows = [(state, now, path, only_from) for path in paths]
+        elif keep:
+            query += f" AND state NOT IN ({', '.join('?' * len(keep))})"
+            rows = [(state, now, path, *keep) for path in paths]
+        else:
+            rows = [(state, now, path) for path in paths]
+        with self.conn:
+            return self.conn.executemany(query, rows).rowcount
+
+    def add(self, paths: Iterable[str], state: str = PENDING) -> int:
+        """Insert paths not seen before; existing rows keep their state."""
+        now = time.time()
+        with self.conn:
+            return self.conn.executemany(
+                "INSERT OR IGNORE INTO items (path, state, updated) VALUES (?, ?, ?)",
+                ((path, state, now) for path in paths),
+            ).rowcount
+
+    def mark(self, paths: Iterable[str], state: str, *, keep: tuple[str, ...] = ()) -> int:
+        """Move paths to ``state``, except rows currently in one of the ``keep`` states."""
+        return self._set_state(paths, state, keep=keep)
+
+    def recover(self) -> int:
+        """Return rows left in flight by an interrupted run to the queue."""
+        with self.conn:
+            return self.conn.execute(
+                "UPDATE items SET state = ? WHERE state = ?", (PENDING, IN_FLIGHT)
+            ).rowcount
+
+    def requeue(self, paths: Iterable[str]) -> int:
+        """Make paths pending again with a fresh attempt budget, e.g. to refresh them."""
+        now = time.time()
+        with self.conn:
+            return self.conn.executemany(
+                "UPDATE items SET state = ?, attempts = 0, next_eligible = 0, updated = ?"
+                " WHERE path = ? AND state != ?",
+                ((PENDING, now, path, IN_FLIGHT) for path in paths),
+            ).rowcount
+
+    def retry_failed(self) -> int:
+        with self.conn:
+            return self.conn.execute(
+                "UPDATE items SET state = ?, attempts = 0, next_eligible = 0 WHERE state = ?",
+                (PENDING, FAILED),
+            ).rowcount
+
+    def claim(self, limit: int, now: Optional[float] = None) -> list[str]:
+        """Move up to ``limit`` eligible pending paths to in flight and return them."""
+        now = time.time() if now is None else now
+        rows = self.conn.execute(
+            "SELECT path FROM items WHERE state = ? AND next_eligible <= ?"
+            " ORDER BY next_eligible, path LIMIT ?",
+            (PENDING, now, limit),
+        ).fetchall()
+        paths = [path for (path,) in rows]
+        self._set_state(paths, IN_FLIGHT)
+        return paths
+
+    def next_eligible(self) -> Optional[float]:
+        """Earliest time a pending path becomes eligible, or None if none is pending."""
+        (value,) = self.conn.execute(
+            "SELECT MIN(next_eligible) FROM items WHERE state = ?", (PENDING,)
+        ).fetchone()
+        return value
+
+    def finish(
+        self,
+        path: str,
+        state: str,
+        *,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> None:
+        """Record a completed fetch along with the response's cache validators."""
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                "UPDATE items SET state = ?, attempts = attempts + 1, last_error = NULL,"
+                " etag = ?, last_modified = ?, checked = ?, updated = ? WHERE path = ?",
+                (state, etag, last_modified, now, now, path),
+            )
+
+    def validators(self, path: str) -> tuple[Optional[str], Optional[str]]:
+        """The ETag and Last-Modified stored by the last completed fetch."""
+        row = self.conn.execute(
+            "SELECT etag, last_modified FROM items WHERE path = ?", (path,)
+        ).fetchone()
+        return row if row else (None, None)
+
+    def checked_times(self) -> dict[str, float]:
+        return dict(
+            self.conn.execute("SELECT path, checked FROM items WHERE checked IS NOT NULL")
+        )
+
+    def release(self, path: str) -> None:
+        """Put an in-flight path back without counting an attempt."""
+        self._set_state([path], PENDING, only_from=IN_FLIGHT)
+
+    def fail(self, path: str, error: str, *, delay: float, max_attempts: int) -> str:
+        """Record a failed attempt; the path waits ``delay`` seconds or gives up.
+
+        Returns the new state.
+        """
+        now = time.time()
+        (attempts,) = self.conn.execute(
+            "SELECT attempts FROM items WHERE path = ?", (path,)
+        ).fetchone()
+        attempts += 1
+        state = FAILED if attempts >= max_attempts else PENDING
+        with self.conn:
+            self.conn.execute(
+                "UPDATE items SET state = ?, attempts = ?, next_eligible = ?, last_error = ?,"
+                " updated = ? WHERE path = ?",
+                (state, attempts, now + delay, error, now, path),
+            )
+        return state
+
+    def attempts(self, path: str) -> int:
+        row = self.conn.execute("SELECT attempts FROM items WHERE path = ?", (path,)).fetchone()
+        return row[0] if row else 0
+
+    def counts(self) -> dict[str, int]:
+        return dict(self.conn.execute("SELECT state, COUNT(*) FROM items GROUP BY state"))